@@ -0,0 +1,26 @@
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from library.security_lib import SecurityHandler
+from library.slow_queries import slow_queries
+from models import User
+
+
+async def get_current_admin(user: User = Depends(SecurityHandler.get_current_user)) -> User:
+    if not user.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail='Admins only')
+    return user
+
+
+router_admin = APIRouter(
+    prefix='/api/admin',
+    tags=['API', 'Admin'],
+    dependencies=[Depends(get_current_admin)]
+)
+
+
+@router_admin.get('/slow-queries')
+async def get_slow_queries(route: str = '', limit: int = Query(50, ge=1, le=500)) -> list[dict]:
+    records = [asdict(record) for record in reversed(slow_queries) if not route or record.route == route]
+    return records[:limit]
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, status, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import APIRouter, status, Depends, HTTPException, Request
 from api.schemas_user import RegisterUserRequest, BaseFields
 from database import get_async_session
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 import dao
 from library.security_lib import PasswordEncrypt
-from library.email_sender import send_email_verification
+from library.email_sender import queue_email_verification
 
 
 router = APIRouter(
@@ -17,7 +17,6 @@ router = APIRouter(
 async def create_user_account(
         request: Request,
         new_user: RegisterUserRequest,
-        background_tasks: BackgroundTasks,
         session: AsyncSession = Depends(get_async_session),
 ) -> RegisterUserRequest:
 
@@ -33,14 +32,16 @@ async def create_user_account(
         email=new_user.email,
         hashed_password=hashed_password,
         session=session,
+        commit=False,
     )
-    background_tasks.add_task(
-        send_email_verification,
+    await queue_email_verification(
+        session,
         user_email=saved_user.email,
         user_uuid=saved_user.user_uuid,
         user_name=saved_user.name,
         host=request.base_url,
     )
+    await session.commit()
 
     return new_user
 
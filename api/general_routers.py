@@ -1,4 +1,10 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dao
+from api.schemas_product import ProductPage, CommentPage
+from database import get_read_session
+from library.conditional import make_etag, is_not_modified, not_modified, add_validators
 from library.security_lib import SecurityHandler
 
 router_public = APIRouter(
@@ -14,11 +20,40 @@ router_private = APIRouter(
 )
 
 
+router_comments = APIRouter(
+    prefix='/api/public/comments',
+    tags=['API', 'Comments', 'Public']
+)
+
+
 @router_public.get('/')
-async def get_products():
-    return {'products': 1000}
+async def get_products(
+        request: Request,
+        response: Response,
+        q: str = '',
+        cursor: str | None = None,
+        limit: int = Query(12, ge=1, le=100),
+        session: AsyncSession = Depends(get_read_session),
+) -> ProductPage:
+    last_modified = await dao.get_catalogue_last_modified(session)
+    etag = make_etag('products', q, cursor, limit, last_modified)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified)
+    page = await dao.fetch_products(session, limit=limit, q=q, cursor=cursor)
+    add_validators(response, etag, last_modified)
+    return ProductPage(items=page.items, next_cursor=page.next_cursor)
 
 
 @router_private.get('/vip-products/')
 async def get_products_private():
-    return {'products': 500000}
\ No newline at end of file
+    return {'products': 500000}
+
+
+@router_comments.get('/')
+async def get_comments(
+        cursor: str | None = None,
+        limit: int = Query(20, ge=1, le=100),
+        session: AsyncSession = Depends(get_read_session),
+) -> CommentPage:
+    page = await dao.fetch_comments(session, limit=limit, cursor=cursor)
+    return CommentPage(items=page.items, next_cursor=page.next_cursor)
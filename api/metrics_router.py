@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from library.metrics import render_metrics
+
+
+router = APIRouter(
+    tags=['Metrics'],
+    include_in_schema=False,
+)
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    return render_metrics()
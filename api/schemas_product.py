@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+
+class ProductResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    price: float
+    image_url: str | None = None
+    image_file: str | None = None
+    created_at: datetime
+
+
+class ProductPage(BaseModel):
+    items: list[ProductResponse]
+    next_cursor: str | None = None
+
+
+class CommentResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    text_review: str
+    user_id: int
+    created_at: datetime | None = None
+
+
+class CommentPage(BaseModel):
+    items: list[CommentResponse]
+    next_cursor: str | None = None
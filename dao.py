@@ -1,13 +1,25 @@
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, tuple_, or_, func, literal, text, Integer, DateTime
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
 from sqlalchemy.orm import joinedload
-
-from models import User, UserRefreshToken, Product, OrderProduct, Order, Comments
-from database import async_session_maker
+from sqlalchemy.orm.attributes import set_committed_value
+
+from database import is_primary
+from models import User, UserRefreshToken, Product, OrderProduct, Order, Comments, EmailOutbox
+import statements
+from library.batch_loader import BatchLoader
+from library.cache import user_cache
+from library.catalogue_cache import catalogue_cache
+from library.single_flight import read_flights
+from library.pagination import Page, StreamedPage, encode_cursor, decode_cursor
+from settings import settings
 
 import datetime
+import re
+
+_MISSING = object()
 
 
 async def create_user(
@@ -17,7 +29,9 @@ async def create_user(
         session: AsyncSession,
         is_admin: bool = False,
         avatar: str = '',
+        commit: bool = True,
 ) -> User:
+    """With `commit=False` the user is only flushed, so the caller can add more rows to the same transaction."""
     user = User(
         email=email,
         name=name,
@@ -27,8 +41,10 @@ async def create_user(
     )
     session.add(user)
     try:
-        await session.commit()
-        await session.refresh(user)
+        await session.flush()
+        if commit:
+            await session.commit()
+            await session.refresh(user)
         return user
     except IntegrityError:
         await session.rollback()
@@ -44,7 +60,7 @@ async def is_first_user(session: AsyncSession) -> bool:
 
 
 async def get_user_by_email(email: str, session: AsyncSession) -> User | None:
-    query = select(User).filter_by(email=email)
+    query = statements.user_by_email(email)
     result = await session.execute(query)
     return result.scalar_one_or_none()
 
@@ -69,15 +85,22 @@ async def activate_user_account(user_uuid: str, session: AsyncSession) -> User |
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    user_cache.invalidate(email=user.email)
     return user
 
 
-async def fetch_users(skip: int = 0, limit: int = 10) -> list[User]:
-    async with async_session_maker() as session:
-        query = select(User).offset(skip).limit(limit)
-        result = await session.execute(query)
+async def fetch_users(session: AsyncSession, skip: int = 0, limit: int = 10) -> list[User]:
+    query = select(User).offset(skip).limit(limit)
+    result = await session.execute(query)
+    return result.scalars().all()
+
+def user_loader(session: AsyncSession) -> BatchLoader:
+    return BatchLoader.for_session(session, User)
+
+
+def product_loader(session: AsyncSession) -> BatchLoader:
+    return BatchLoader.for_session(session, Product)
 
-        return result.scalars().all()
 
 # async def get_user_by_id(user_id: int) -> User | None:
 #     async with async_session_maker() as session:
@@ -87,20 +110,31 @@ async def fetch_users(skip: int = 0, limit: int = 10) -> list[User]:
 #
 
 
-async def update_user(user_id: int, values: dict):
+async def update_user(user_id: int, values: dict, session: AsyncSession):
     if not values:
         return
-    async with async_session_maker() as session:
-        query = update(User).where(User.id == user_id).values(**values)
-        await session.execute(query)
-        await session.commit()
+    query = update(User).where(User.id == user_id).values(**values)
+    await session.execute(query)
+    await session.commit()
+    user_cache.invalidate(user_id=user_id)
 
 
-async def delete_product(product_id: int):
-    async with async_session_maker() as session:
-        query = update(Product).where(Product.id == product_id).values(deleted_at=datetime.datetime.utcnow())
-        await session.execute(query)
-        await session.commit()
+async def ban_user(user_id: int, session: AsyncSession):
+    await update_user(user_id, {'is_active': False}, session)
+
+
+async def delete_product(product_id: int, session: AsyncSession):
+    query = update(Product).where(Product.id == product_id).values(deleted_at=datetime.datetime.utcnow())
+    await session.execute(query)
+    await _announce_catalogue_change(session)
+    await session.commit()
+    catalogue_cache.bump()
+
+
+async def _announce_catalogue_change(session: AsyncSession):
+    # NOTIFY is delivered on commit, so other workers only drop their caches once the change is visible
+    if settings.CATALOGUE_NOTIFY_CHANNEL:
+        await session.execute(select(func.pg_notify(settings.CATALOGUE_NOTIFY_CHANNEL, '')))
 
 
 async def create_refresh_token(
@@ -131,6 +165,19 @@ async def get_refresh_token_by_key(key: str, session: AsyncSession) -> UserRefre
     return user_token.scalar_one_or_none()
 
 
+async def delete_expired_refresh_tokens(session: AsyncSession, batch_size: int) -> int:
+    expired_ids = (
+        select(UserRefreshToken.id)
+        .where(UserRefreshToken.expires_at <= datetime.datetime.utcnow())
+        .limit(batch_size)
+    )
+    result = await session.execute(
+        delete(UserRefreshToken).where(UserRefreshToken.id.in_(expired_ids.scalar_subquery()))
+    )
+    await session.commit()
+    return result.rowcount
+
+
 async def add_product(
         title: str,
         price: float,
@@ -146,7 +193,10 @@ async def add_product(
     )
     session.add(product)
     try:
+        await session.flush()
+        await _announce_catalogue_change(session)
         await session.commit()
+        catalogue_cache.bump()
         await session.refresh(product)
         return product
     except IntegrityError:
@@ -175,23 +225,99 @@ async def add_comment(
         return None
 
 
-async def fetch_comments(skip: int = 0, limit: int = 120) -> list[Comments]:
-    async with async_session_maker() as session:
-        query = select(Comments).offset(skip).limit(limit)
-        result = await session.execute(query)
-        return result.scalars().all()
+def _seek(query, model, cursor: str | None, limit: int):
+    """Keyset pagination over (created_at, id), newest first; a plain row comparison every page can seek on."""
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(tuple_(model.created_at, model.id) < (created_at, item_id))
+    return query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
 
+def _page(items: list, limit: int) -> Page:
+    if len(items) <= limit:
+        return Page(items=list(items), next_cursor=None)
+    last = items[limit - 1]
+    return Page(items=list(items[:limit]), next_cursor=encode_cursor(last.created_at, last.id))
 
-async def fetch_products(session: AsyncSession, offset=0, limit=12, q='') -> list:
-    if q:
-        query = select(Product).filter(
-            Product.title.icontains(q),
-            Product.deleted_at == None
-            ).offset(offset).limit(limit)
-    else:
-        query = select(Product).filter(Product.deleted_at == None).offset(offset).limit(limit)
+
+async def fetch_comments(session: AsyncSession, limit: int = 120, cursor: str | None = None) -> Page:
+    query = _seek(select(Comments), Comments, cursor, limit)
     result = await session.execute(query)
-    return result.scalars().all() or []
+    return _page(result.scalars().all(), limit)
+
+
+async def stream_comments(session: AsyncSession, limit: int = 120, cursor: str | None = None) -> StreamedPage:
+    """Like `fetch_comments`, but rows arrive through a server-side cursor while the page is being rendered."""
+    query = _seek(select(Comments), Comments, cursor, limit)
+    result = await session.stream_scalars(query)
+    authors = user_loader(session)
+    return StreamedPage(
+        result, limit, settings.DB_STREAM_PARTITION_SIZE,
+        prefetch=lambda comments: authors.load_many(comment.user_id for comment in comments),
+    )
+
+
+async def fetch_products(session: AsyncSession, limit=12, q='', cursor: str | None = None) -> Page:
+    """Product listing or search results as `ProductSnapshot`s, served from the catalogue cache when possible."""
+    key = ('products', q, cursor, limit)
+    page = catalogue_cache.get(key)
+    if page is not None:
+        return page
+
+    primary = is_primary(session)
+
+    async def load() -> Page:
+        version, cacheable = catalogue_cache.version, catalogue_cache.accepts(primary)
+        if q:
+            page = Page(items=await search_products(session, q, limit=limit), next_cursor=None)
+        else:
+            query = statements.product_page(decode_cursor(cursor) if cursor else None, limit + 1)
+            result = await session.execute(query)
+            page = _page(result.scalars().all(), limit)
+        return catalogue_cache.set(key, page, version) if cacheable else catalogue_cache.snapshot(page)
+
+    # concurrent misses for one page share a single query; snapshots are safe to hand to other requests, but
+    # primary and replica reads never share one, so a client pinned to the primary never gets a lagging result
+    timeout = settings.SINGLE_FLIGHT_SEARCH_TIMEOUT_SECONDS if q else None
+    return await read_flights.run((catalogue_cache.version, key, primary), load, timeout=timeout)
+
+
+async def get_catalogue_last_modified(session: AsyncSession) -> datetime.datetime | None:
+    """Latest product insert or soft delete, the validator behind catalogue ETags."""
+    last_modified = catalogue_cache.get('last_modified', _MISSING)
+    if last_modified is not _MISSING:
+        return last_modified
+
+    primary = is_primary(session)
+
+    async def load() -> datetime.datetime | None:
+        version, cacheable = catalogue_cache.version, catalogue_cache.accepts(primary)
+        query = select(func.greatest(func.max(Product.created_at), func.max(Product.deleted_at)))
+        last_modified = (await session.execute(query)).scalar()
+        if cacheable:
+            catalogue_cache.set_value('last_modified', last_modified, version)
+        return last_modified
+
+    return await read_flights.run((catalogue_cache.version, 'last_modified', primary), load)
+
+
+def _prefix_tsquery(q: str) -> str:
+    return ' & '.join(f'{word}:*' for word in re.findall(r'\w+', q))
+
+
+async def search_products(session: AsyncSession, q: str, limit: int = 12) -> list[Product]:
+    """Relevance-ordered search: word prefixes through the tsvector index, substrings through the trigram index."""
+    terms = _prefix_tsquery(q)
+    if not terms:
+        return []
+    tsquery = func.to_tsquery('simple', terms)
+    rank = func.ts_rank(Product.search_vector, tsquery) + func.similarity(Product.title, q)
+    query = select(Product).filter(
+        Product.deleted_at == None,
+        or_(Product.search_vector.op('@@')(tsquery), Product.title.icontains(q)),
+    ).order_by(rank.desc(), Product.id.desc()).limit(limit)
+    result = await session.execute(query)
+    return result.scalars().all()
 
 
 async def get_product(session: AsyncSession, product_id: int) -> Product | None:
@@ -213,12 +339,16 @@ async def get_or_create(session: AsyncSession, model, only_get=False, **kwargs):
     return instance
 
 
-async def fetch_order_products(session: AsyncSession, order_id: int) -> list:
-    query = select(OrderProduct).filter(OrderProduct.order_id == order_id,
-                                        OrderProduct.quantity > 0,
-                                        OrderProduct.price > 0).options(joinedload(OrderProduct.product))
+async def fetch_order_products(session: AsyncSession, order_id: int, with_products: bool = False) -> list:
+    """Cart lines of an order; `with_products` also fills `item.product` with one batched query."""
+    query = statements.order_products(order_id)
     result = await session.execute(query)
-    return result.scalars().all() or []
+    items = result.scalars().all() or []
+    if with_products and items:
+        products = await product_loader(session).load_many(item.product_id for item in items)
+        for item in items:
+            set_committed_value(item, 'product', products[item.product_id])
+    return items
 
 
 async def get_order_product(session: AsyncSession, order_id: int, product_id: int) -> OrderProduct | None:
@@ -230,31 +360,149 @@ async def get_order_product(session: AsyncSession, order_id: int, product_id: in
     return result.scalar_one_or_none()
 
 
-async def decrease_product_quantity_in_order(session: AsyncSession, order_id: int, product_id: int):
-    order_product = await session.execute(
-        select(OrderProduct).filter(OrderProduct.order_id == Order.id, OrderProduct.product_id == Product.id)
+async def add_product_to_order(session: AsyncSession, user_id: int, product_id: int) -> int | None:
+    """Put one more unit of a product into the user's open order in a single statement; returns the new quantity.
+
+    The open order is created in the same statement, and only if the product exists, so an unknown or deleted
+    product leaves nothing behind.
+    """
+    now = datetime.datetime.utcnow()
+    product = select(Product.id, Product.price).where(Product.id == product_id, Product.deleted_at == None).cte('product')
+    orders = Order.__table__
+    open_order = insert(orders).from_select(
+        ['user_id', 'is_closed', 'created_at'],
+        select(literal(user_id, Integer), literal(False), literal(now, DateTime)).select_from(product),
+    )
+    # a no-op update instead of DO NOTHING, so an existing open order still returns its id
+    open_order = open_order.on_conflict_do_update(
+        index_elements=['user_id'], index_where=text('NOT is_closed'), set_={'is_closed': False},
+    ).returning(orders.c.id).cte('open_order')
+    product_line = select(
+        open_order.c.id, product.c.id, product.c.price, literal(1, Integer), literal(now, DateTime),
     )
-    order_product = order_product.scalar_one_or_none()
+    order_products = OrderProduct.__table__
+    query = insert(order_products).from_select(
+        ['order_id', 'product_id', 'price', 'quantity', 'created_at'], product_line,
+    )
+    query = query.on_conflict_do_update(
+        constraint='uq_order_products_order_id_product_id',
+        set_={'quantity': order_products.c.quantity + 1, 'price': query.excluded.price},
+    ).returning(order_products.c.quantity)
+    result = await session.execute(query)
+    quantity = result.scalar_one_or_none()
+    await session.commit()
+    return quantity
 
-    if order_product:
-        if order_product.quantity > 1:
-            order_product.quantity -= 1
-        else:
-            await session.delete(order_product)
 
-        await session.commit()
+async def increase_product_quantity_in_order(session: AsyncSession, order_id: int, order_product_id: int) -> int | None:
+    query = (
+        update(OrderProduct)
+        .where(OrderProduct.id == order_product_id, OrderProduct.order_id == order_id)
+        .values(quantity=OrderProduct.quantity + 1)
+        .returning(OrderProduct.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    quantity = result.scalar_one_or_none()
+    await session.commit()
+    return quantity
 
 
-async def delete_order_product(product_id: int):
-    async with async_session_maker() as session:
-        query = delete(OrderProduct).where(OrderProduct.id == product_id)
-        await session.execute(query)
-        await session.commit()
+async def decrease_product_quantity_in_order(session: AsyncSession, order_id: int, order_product_id: int) -> int | None:
+    """Take one unit off an order line, deleting the line when its last unit goes, in one statement."""
+    deleted = (
+        delete(OrderProduct)
+        .where(OrderProduct.id == order_product_id, OrderProduct.order_id == order_id, OrderProduct.quantity <= 1)
+        .returning(OrderProduct.id)
+        .cte('deleted')
+    )
+    query = (
+        update(OrderProduct)
+        .where(OrderProduct.id == order_product_id, OrderProduct.order_id == order_id, OrderProduct.quantity > 1)
+        .values(quantity=OrderProduct.quantity - 1)
+        .returning(OrderProduct.quantity)
+        .add_cte(deleted)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    quantity = result.scalar_one_or_none()
+    await session.commit()
+    return quantity or 0
 
 
-async def get_open_order(session: AsyncSession, user_id: int):
-    open_order = await session.execute(
-        select(Order).filter(Order.user_id == user_id, Order.is_closed == False)
+async def delete_order_product(session: AsyncSession, order_id: int, order_product_id: int):
+    query = (
+        delete(OrderProduct)
+        .where(OrderProduct.id == order_product_id, OrderProduct.order_id == order_id)
+        .execution_options(synchronize_session=False)
     )
+    await session.execute(query)
+    await session.commit()
+
+
+async def get_open_order(session: AsyncSession, user_id: int):
+    open_order = await session.execute(statements.open_order(user_id))
     open_order = open_order.scalar_one_or_none()
     return open_order
+
+
+async def enqueue_email(
+        session: AsyncSession,
+        recipients: list[str],
+        subject: str,
+        body: str,
+        mime_type: str = 'html',
+) -> EmailOutbox:
+    """Add a message to the outbox without committing, so it is only sent if the caller's transaction commits."""
+    email = EmailOutbox(recipients=recipients, subject=subject, body=body, mime_type=mime_type)
+    session.add(email)
+    return email
+
+
+async def claim_outbox_emails(session: AsyncSession, limit: int, lease_seconds: float) -> list[EmailOutbox]:
+    """Lease up to `limit` due messages; other workers skip them until the lease runs out."""
+    now = datetime.datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(
+            EmailOutbox.sent_at.is_(None),
+            EmailOutbox.attempts < settings.EMAIL_MAX_ATTEMPTS,
+            EmailOutbox.next_attempt_at <= now,
+        )
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    query = (
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(due.scalar_subquery()))
+        .values(next_attempt_at=now + datetime.timedelta(seconds=lease_seconds))
+        .returning(EmailOutbox)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(query)
+    emails = result.scalars().all()
+    await session.commit()
+    return emails
+
+
+async def mark_emails_sent(session: AsyncSession, email_ids: list[int]):
+    if not email_ids:
+        return
+    query = update(EmailOutbox).where(EmailOutbox.id.in_(email_ids)).values(sent_at=datetime.datetime.utcnow())
+    await session.execute(query)
+    await session.commit()
+
+
+async def reschedule_email(session: AsyncSession, email_id: int, error: str, retry_in: float):
+    query = (
+        update(EmailOutbox)
+        .where(EmailOutbox.id == email_id)
+        .values(
+            attempts=EmailOutbox.attempts + 1,
+            last_error=error,
+            next_attempt_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=retry_in),
+        )
+    )
+    await session.execute(query)
+    await session.commit()
@@ -1,13 +1,66 @@
+import itertools
+import time
+from contextvars import ContextVar
 from typing import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession, AsyncEngine
+from sqlalchemy.orm import DeclarativeBase, Session
 
+from library import query_stats, slow_queries
+from library.pool_metrics import PoolMetrics
 from settings import settings
 
+PRIMARY_UNTIL_COOKIE = 'db_primary_until'
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
-async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
+# holds a per-request dict the session events below mark when the request commits on the primary
+request_writes: ContextVar[dict | None] = ContextVar('request_writes', default=None)
+
+
+def make_engine(url: str, metrics_prefix: str) -> AsyncEngine:
+    pool_metrics = PoolMetrics(metrics_prefix)
+    new_engine = create_async_engine(
+        url,
+        echo=False,
+        poolclass=pool_metrics.pool_class,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args={'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE},
+    )
+    pool_metrics.instrument(new_engine)
+    query_stats.install(new_engine)
+    slow_queries.install(new_engine)
+    return new_engine
+
+
+class PrimarySession(Session):
+    pass
+
+
+@event.listens_for(PrimarySession, 'after_commit')
+def _remember_write(session: Session):
+    writes = request_writes.get()
+    if writes is not None:
+        writes['primary_until'] = time.time() + settings.READ_YOUR_WRITES_SECONDS
+
+
+def is_primary(session: AsyncSession) -> bool:
+    return isinstance(session.sync_session, PrimarySession)
+
+
+engine = make_engine(settings.DATABASE_URL, 'db_pool')
+async_session_maker = async_sessionmaker(engine, expire_on_commit=False, sync_session_class=PrimarySession)
+
+replica_engines = [
+    make_engine(url, f'db_replica{number}_pool')
+    for number, url in enumerate(settings.DATABASE_REPLICA_URLS, start=1)
+]
+replica_session_makers = [async_sessionmaker(replica, expire_on_commit=False) for replica in replica_engines]
+_next_replica = itertools.cycle(replica_session_makers)
 
 
 class Base(DeclarativeBase):
@@ -20,3 +73,36 @@ async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
             yield session
         finally:
             await session.close()
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Clients that wrote within READ_YOUR_WRITES_SECONDS keep reading from the primary."""
+    try:
+        return float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_session_maker(primary: bool = False) -> async_sessionmaker:
+    """Next replica session maker when replicas are configured and `primary` is not requested."""
+    if replica_session_makers and not primary:
+        return next(_next_replica)
+    return async_session_maker
+
+
+async def get_read_session(
+        request: Request, primary_session: AsyncSession = Depends(get_async_session),
+) -> AsyncGenerator[AsyncSession, None]:
+    """Session for read-only DAO calls: a replica when one is configured, the primary otherwise.
+
+    On the primary this is the request's own session (FastAPI caches it per request), so the auth lookup and the
+    route share one pooled connection.
+    """
+    if not replica_session_makers or reads_from_primary(request):
+        yield primary_session
+        return
+    async with read_session_maker()() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
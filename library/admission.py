@@ -0,0 +1,146 @@
+import enum
+from dataclasses import dataclass
+
+from fastapi import APIRouter
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.routing import BaseRoute, Match
+
+from database import engine, replica_engines
+from library import metrics
+from settings import settings
+
+
+class Priority(enum.IntEnum):
+    LOW = 0
+    NORMAL = 1
+    CRITICAL = 2
+
+
+@dataclass(frozen=True)
+class Limits:
+    in_flight: int
+    pool_wait: float | None = None
+    pool_waiters: int | None = None
+
+
+@dataclass(frozen=True)
+class Rule:
+    route: object
+    priority: Priority
+    anonymous: Priority | None = None
+
+
+class AdmissionControl:
+    """Decides per request whether the worker has room for it, given its priority class.
+
+    Low and normal requests are refused early, while in-flight requests or pool checkout waits pass their limits,
+    so critical ones (checkout, auth) always find headroom in the pool. Priorities are assigned per router, with
+    per-path overrides; requests that match nothing are NORMAL. Exempt routes (static files) bypass admission.
+    """
+
+    def __init__(self):
+        self.rules: list[Rule] = []
+        self.exempt_routes: list[BaseRoute] = []
+        self.in_flight = 0
+        self.in_flight_gauge = metrics.Gauge('admission_in_flight', 'Requests admitted and not finished yet')
+        self.shed = {
+            priority: metrics.Counter(f'admission_shed_{priority.name.lower()}_total',
+                                      f'{priority.name.capitalize()} priority requests refused with a 503')
+            for priority in Priority
+        }
+        self.limits = {
+            Priority.LOW: Limits(
+                in_flight=int(settings.ADMISSION_MAX_IN_FLIGHT * settings.ADMISSION_LOW_SHARE),
+                pool_wait=settings.ADMISSION_LOW_MAX_POOL_WAIT_SECONDS,
+                pool_waiters=settings.ADMISSION_LOW_MAX_POOL_WAITERS,
+            ),
+            Priority.NORMAL: Limits(
+                in_flight=int(settings.ADMISSION_MAX_IN_FLIGHT * settings.ADMISSION_NORMAL_SHARE),
+                pool_wait=settings.ADMISSION_NORMAL_MAX_POOL_WAIT_SECONDS,
+                pool_waiters=settings.ADMISSION_NORMAL_MAX_POOL_WAITERS,
+            ),
+            Priority.CRITICAL: Limits(in_flight=settings.ADMISSION_MAX_IN_FLIGHT),
+        }
+
+    def assign(self, router: APIRouter, priority: Priority, anonymous: Priority | None = None,
+               paths: dict[str, Priority] | None = None):
+        """Give every route of `router` a priority; `anonymous` applies instead when there is no login cookie."""
+        paths = paths or {}
+        overrides = [Rule(route, paths[route.path]) for route in router.routes if route.path in paths]
+        # path overrides are checked before the router wide rules
+        self.rules[:0] = overrides
+        self.rules.extend(Rule(route, priority, anonymous) for route in router.routes)
+
+    def exempt(self, *routes: BaseRoute):
+        """Let requests for `routes` through without a priority; they are never refused nor counted in flight."""
+        self.exempt_routes.extend(routes)
+
+    def priority(self, scope) -> Priority | None:
+        for route in self.exempt_routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return None
+        for rule in self.rules:
+            match, _ = rule.route.matches(scope)
+            if match == Match.FULL:
+                if rule.anonymous is not None and 'token' not in HTTPConnection(scope).cookies:
+                    return rule.anonymous
+                return rule.priority
+        return Priority.NORMAL
+
+    @staticmethod
+    def pool_pressure() -> tuple[float, int]:
+        """Worst recent checkout wait and total checkouts waiting right now, across primary and replicas."""
+        pools = [db_engine.sync_engine.pool for db_engine in [engine, *replica_engines]]
+        pool_metrics = [pool.pool_metrics for pool in pools if hasattr(pool, 'pool_metrics')]
+        return (
+            max((item.recent_wait() for item in pool_metrics), default=0.0),
+            sum(item.waiting.value for item in pool_metrics),
+        )
+
+    def admits(self, priority: Priority) -> bool:
+        limits = self.limits[priority]
+        if self.in_flight >= limits.in_flight:
+            return False
+        if limits.pool_wait is None and limits.pool_waiters is None:
+            return True
+        pool_wait, pool_waiters = self.pool_pressure()
+        if limits.pool_wait is not None and pool_wait > limits.pool_wait:
+            return False
+        return limits.pool_waiters is None or pool_waiters <= limits.pool_waiters
+
+
+admission = AdmissionControl()
+
+
+class AdmissionMiddleware:
+    """Refuses requests with a fast 503 and Retry-After when their priority class is over its limits."""
+
+    def __init__(self, app, control: AdmissionControl = admission):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        priority = self.control.priority(scope)
+        if priority is None:
+            return await self.app(scope, receive, send)
+        if not self.control.admits(priority):
+            self.control.shed[priority].inc()
+            response = JSONResponse(
+                {'detail': 'Server is busy, please try again later'},
+                status_code=503,
+                headers={'Retry-After': str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            return await response(scope, receive, send)
+
+        self.control.in_flight += 1
+        self.control.in_flight_gauge.set(self.control.in_flight)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.control.in_flight -= 1
+            self.control.in_flight_gauge.set(self.control.in_flight)
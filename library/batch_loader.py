@@ -0,0 +1,42 @@
+from typing import Any, Iterable
+
+from sqlalchemy import select, any_, bindparam, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class BatchLoader:
+    """Loads rows of one model by id: the ids a request needs go out as a single `WHERE id = ANY(:ids)` query,
+    and whatever was loaded is remembered for the rest of the session, i.e. the request.
+    """
+
+    def __init__(self, session: AsyncSession, model):
+        self.session = session
+        self.model = model
+        self._loaded: dict[int, Any] = {}
+        self._query = select(model).where(model.id == any_(bindparam('ids', type_=ARRAY(Integer))))
+
+    @classmethod
+    def for_session(cls, session: AsyncSession, model) -> 'BatchLoader':
+        loaders = session.info.setdefault('batch_loaders', {})
+        if model not in loaders:
+            loaders[model] = cls(session, model)
+        return loaders[model]
+
+    async def load_many(self, ids: Iterable[int]) -> dict[int, Any]:
+        ids = list(dict.fromkeys(ids))
+        missing = [item_id for item_id in ids if item_id not in self._loaded]
+        if missing:
+            result = await self.session.execute(self._query, {'ids': missing})
+            for instance in result.scalars():
+                self._loaded[instance.id] = instance
+            for item_id in missing:
+                self._loaded.setdefault(item_id, None)
+        return {item_id: self._loaded[item_id] for item_id in ids}
+
+    async def load(self, item_id: int) -> Any:
+        return (await self.load_many([item_id]))[item_id]
+
+    def get(self, item_id: int) -> Any:
+        """Already loaded instance, or None; never queries."""
+        return self._loaded.get(item_id)
@@ -0,0 +1,133 @@
+import hashlib
+import heapq
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from library import metrics
+from settings import settings
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = metrics.Counter(f'{name}_cache_hits_total', f'Lookups served from the {name} cache')
+        self.misses = metrics.Counter(f'{name}_cache_misses_total', f'Lookups missing the {name} cache')
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses.inc()
+            return default
+        self._data.move_to_end(key)
+        self.hits.inc()
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> Any:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def remove_where(self, predicate: Callable[[Any], bool]):
+        for key in [key for key, (_, value) in self._data.items() if predicate(value)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class UserCache(TTLCache):
+    """Detached `User` instances keyed by email, shared by the API and web auth dependencies."""
+
+    def invalidate(self, user_id: int | None = None, email: str | None = None):
+        if email:
+            self.pop(email)
+        if user_id is not None:
+            self.remove_where(lambda user: user.id == user_id)
+
+
+class RevocationList:
+    """Digests of revoked tokens, each kept until the token itself expires and never evicted before that.
+
+    Unlike `TTLCache` there is no size bound: dropping an entry early would make a revoked token valid again.
+    """
+
+    def __init__(self, name: str):
+        self._expires: dict[str, float] = {}
+        self._heap: list[tuple[float, str]] = []
+        self.size = metrics.Gauge(f'{name}_revoked_tokens', 'Revoked tokens that have not expired yet')
+
+    def add(self, key: str, expires_at: float):
+        self._purge()
+        if expires_at > self._expires.get(key, 0):
+            self._expires[key] = expires_at
+            heapq.heappush(self._heap, (expires_at, key))
+        self.size.set(len(self._expires))
+
+    def __contains__(self, key: str) -> bool:
+        expires_at = self._expires.get(key)
+        return expires_at is not None and expires_at > time.time()
+
+    def _purge(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expires.get(key) == expires_at:
+                del self._expires[key]
+
+    def clear(self):
+        self._expires.clear()
+        self._heap.clear()
+        self.size.set(0)
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+
+class TokenCache(TTLCache):
+    """Verified JWT payloads keyed by token digest, each entry living no longer than the token itself."""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        super().__init__(name, max_size, ttl)
+        self._revoked = RevocationList(name)
+
+    @staticmethod
+    def digest(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get_payload(self, token: str) -> dict | None:
+        payload = self.get(self.digest(token))
+        return dict(payload) if payload is not None else None
+
+    def add(self, token: str, payload: dict):
+        expires_in = payload.get('exp', time.time() + self.ttl) - time.time()
+        if expires_in > 0:
+            self.set(self.digest(token), dict(payload), ttl=min(self.ttl, expires_in))
+
+    def revoke(self, token: str, payload: dict | None = None):
+        key = self.digest(token)
+        self.pop(key)
+        expires_at = (payload or {}).get('exp', time.time() + self.ttl)
+        if expires_at > time.time():
+            self._revoked.add(key, expires_at)
+
+    def is_revoked(self, token: str) -> bool:
+        return self.digest(token) in self._revoked
+
+
+user_cache = UserCache('user', max_size=settings.USER_CACHE_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS)
+token_cache = TokenCache('token', max_size=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Any, Hashable
+
+import asyncpg
+
+from database import engine
+from library.cache import TTLCache
+from library.pagination import Page
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProductSnapshot:
+    """Immutable, slot-based copy of the product fields listings need, safe to share across requests."""
+
+    __slots__ = ('id', 'title', 'price', 'image_url', 'image_file', 'created_at')
+
+    def __init__(self, id: int, title: str, price: float, image_url: str | None, image_file: str | None,
+                 created_at: datetime):
+        self.id = id
+        self.title = title
+        self.price = price
+        self.image_url = image_url
+        self.image_file = image_file
+        self.created_at = created_at
+
+    @classmethod
+    def from_product(cls, product) -> 'ProductSnapshot':
+        return cls(product.id, product.title, product.price, product.image_url, product.image_file,
+                   product.created_at)
+
+
+class CatalogueCache:
+    """Product pages and search results cached per catalogue version; any product write bumps the version.
+
+    The version moves when the primary commits, so right after a bump a replica may still return the old catalogue;
+    for READ_YOUR_WRITES_SECONDS only primary reads are cached, the same window clients stay pinned to the primary.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.version = 0
+        self.bumped_at = float('-inf')
+        self._pages = TTLCache('catalogue', max_size, ttl)
+
+    def accepts(self, primary: bool) -> bool:
+        """Whether a read starting now on the primary, or on a replica, may be cached under the current version."""
+        return primary or time.monotonic() - self.bumped_at >= settings.READ_YOUR_WRITES_SECONDS
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._pages.get((self.version, key), default)
+
+    def set_value(self, key: Hashable, value: Any, version: int):
+        self._pages.set((version, key), value)
+
+    @staticmethod
+    def snapshot(page: Page) -> Page:
+        snapshots = [item if isinstance(item, ProductSnapshot) else ProductSnapshot.from_product(item)
+                     for item in page.items]
+        return Page(items=snapshots, next_cursor=page.next_cursor)
+
+    def set(self, key: Hashable, page: Page, version: int) -> Page:
+        """Store `page` as snapshots under the version it was read at; a bump meanwhile makes it unreachable."""
+        page = self.snapshot(page)
+        self._pages.set((version, key), page)
+        return page
+
+    def bump(self):
+        self.version += 1
+        self.bumped_at = time.monotonic()
+        self._pages.clear()
+
+
+catalogue_cache = CatalogueCache(max_size=settings.CATALOGUE_CACHE_SIZE, ttl=settings.CATALOGUE_CACHE_TTL_SECONDS)
+
+
+async def listen_for_catalogue_changes():
+    """Bump the local catalogue version whenever another worker announces a product write."""
+    channel = settings.CATALOGUE_NOTIFY_CHANNEL
+    if not channel:
+        return
+    dsn = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            await connection.add_listener(channel, lambda *args: catalogue_cache.bump())
+            # notifications sent while we were disconnected are lost
+            catalogue_cache.bump()
+            while not connection.is_closed():
+                await asyncio.sleep(settings.CATALOGUE_LISTEN_CHECK_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception('Catalogue change listener failed, reconnecting')
+            await asyncio.sleep(settings.CATALOGUE_LISTEN_CHECK_SECONDS)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
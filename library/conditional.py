@@ -0,0 +1,50 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response
+from starlette import status
+
+
+def make_etag(*parts) -> str:
+    """Weak validator over everything a representation depends on."""
+    return 'W/"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def _http_date(value: datetime) -> str:
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+
+def add_validators(response: Response, etag: str, last_modified: datetime | None = None, private: bool = False,
+                   vary: str | None = None):
+    response.headers['ETag'] = etag
+    if vary:
+        response.headers['Vary'] = vary
+    if last_modified is not None:
+        response.headers['Last-Modified'] = _http_date(last_modified)
+    # caches may keep the body but have to revalidate it every time
+    response.headers['Cache-Control'] = 'private, no-cache' if private else 'public, no-cache'
+    return response
+
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime | None = None) -> bool:
+    """Evaluate If-None-Match, falling back to If-Modified-Since only when no ETag was sent (RFC 9110 13.2.2)."""
+    if request.method not in ('GET', 'HEAD'):
+        return False
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return '*' in candidates or etag.removeprefix('W/') in candidates
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            return False
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified(etag: str, last_modified: datetime | None = None, private: bool = False,
+                 vary: str | None = None) -> Response:
+    return add_validators(Response(status_code=status.HTTP_304_NOT_MODIFIED), etag, last_modified, private, vary)
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import smtplib
+
+import dao
+from database import async_session_maker
+from library import metrics
+from library.email_sender import SMTPConnection, build_message
+from models import EmailOutbox
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+emails_sent = metrics.Counter('emails_sent_total', 'Outbox messages handed to the SMTP server')
+email_failures = metrics.Counter('email_send_failures_total', 'Outbox send attempts that failed and were rescheduled')
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff for a message that has already failed `attempts` times."""
+    return min(settings.EMAIL_RETRY_BASE_SECONDS * 2 ** attempts, settings.EMAIL_RETRY_MAX_SECONDS)
+
+
+def _send_batch(connection: SMTPConnection, emails: list[EmailOutbox]) -> tuple[list[int], list[tuple[EmailOutbox, str]]]:
+    sent, failed = [], []
+    for email in emails:
+        try:
+            connection.send(email.recipients, build_message(email.recipients, email.subject, email.body, email.mime_type))
+            sent.append(email.id)
+        except (smtplib.SMTPException, OSError) as error:
+            # drop the session so the next message starts from a clean connection
+            connection.close()
+            failed.append((email, repr(error)))
+    return sent, failed
+
+
+async def deliver_outbox():
+    """Send queued emails in batches over one persistent SMTP connection, rescheduling failures with backoff."""
+    connection = SMTPConnection()
+    try:
+        while True:
+            emails = []
+            try:
+                async with async_session_maker() as session:
+                    emails = await dao.claim_outbox_emails(
+                        session, settings.EMAIL_OUTBOX_BATCH_SIZE, settings.EMAIL_OUTBOX_LEASE_SECONDS,
+                    )
+                if emails:
+                    # smtplib blocks, so the whole batch goes to one worker thread
+                    sent, failed = await asyncio.to_thread(_send_batch, connection, emails)
+                    async with async_session_maker() as session:
+                        await dao.mark_emails_sent(session, sent)
+                        for email, error in failed:
+                            logger.warning('Sending email #%s failed: %s', email.id, error)
+                            await dao.reschedule_email(session, email.id, error, retry_delay(email.attempts))
+                    emails_sent.inc(len(sent))
+                    email_failures.inc(len(failed))
+            except Exception:
+                logger.exception('Email outbox delivery failed')
+
+            if len(emails) < settings.EMAIL_OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(settings.EMAIL_OUTBOX_POLL_SECONDS)
+    finally:
+        await asyncio.to_thread(connection.close)
@@ -1,24 +1,15 @@
-import os
 import smtplib
-from pathlib import Path
-from email import encoders
-from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import dao
 from library.render import render_template
 from settings import settings
 
-def send_email(
-        *,
-        recipients: list[str],
-        mail_body: str,
-        mail_subject: str,
-        attachment: str = None,
-        mime_type: str = "html",
-):
-    SERVER = settings.SMTP_SERVER
-    PASSWORD = settings.EMAIL_TOKEN
+
+def build_message(recipients: list[str], mail_subject: str, mail_body: str, mime_type: str = "html") -> MIMEMultipart:
     USER = settings.EMAIL_USER
 
     msg = MIMEMultipart("alternative")
@@ -29,57 +20,54 @@ def send_email(
     msg["Return-Path"] = USER
     msg["X-Mailer"] = "decorator"
 
-    if attachment:
-        file_exists = os.path.exists(attachment)
-        if not file_exists:
-            print(f"file {attachment} does not exist")
-        else:
-            basename = os.path.basename(attachment)
-            filesize = os.path.getsize(attachment)
-            file = MIMEBase("application", f"octet-stream; name={basename}")
-            file.set_payload(open(attachment, "rb").read())
-            file.add_header("Content-Description", attachment)
-            file.add_header("Content-Description", f"attachment; filename={attachment}; size={filesize}")
-            encoders.encode_base64(file)
-            msg.attach(file)
-
     text_to_send = MIMEText(
         mail_body, mime_type
     )  # plain, html, image, audio, video https://developer.mozilla.org/en-US/docs/Web/HTTP/Basics_of_HTTP/MIME_types
     msg.attach(text_to_send)
+    return msg
 
-    mail = smtplib.SMTP_SSL(SERVER)
-    mail.login(USER, PASSWORD)
-    mail.sendmail(USER, recipients, msg.as_string())
-    mail.quit()
 
+class SMTPConnection:
+    """One authenticated SMTP session reused for every message; it reconnects once when the server hung up."""
 
-def send_email_verification(user_email, user_uuid, user_name, host: str = "http://127.0.0.1:8000/"):
-    activate_url = f'{host}api/user/verify/{user_uuid}'
+    def __init__(self):
+        self._smtp: smtplib.SMTP | None = None
 
-    with open(
-            Path(__file__).parent / 'email_verification.html',
-            encoding='utf-8') as file:
-        content = file.read()
-        content = content \
-            .replace('{{ user }}', user_name) \
-            .replace('{{ link }}', activate_url)
+    def _connect(self) -> smtplib.SMTP:
+        smtp_class = smtplib.SMTP_SSL if settings.SMTP_USE_SSL else smtplib.SMTP
+        smtp = smtp_class(settings.SMTP_SERVER, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        if settings.EMAIL_USER and settings.EMAIL_TOKEN:
+            smtp.login(settings.EMAIL_USER, settings.EMAIL_TOKEN)
+        return smtp
 
-    send_email(
-        recipients=[user_email],
-        mail_body=content,
-        mail_subject=f'Account verification'
-    )
+    def send(self, recipients: list[str], msg: MIMEMultipart):
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.sendmail(settings.EMAIL_USER, recipients, msg.as_string())
+        except smtplib.SMTPServerDisconnected:
+            self._smtp = self._connect()
+            self._smtp.sendmail(settings.EMAIL_USER, recipients, msg.as_string())
 
+    def close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                # the session is being dropped anyway; a dead socket must not abort the batch
+                smtp.close()
+
+
+async def queue_email_verification(session: AsyncSession, user_email, user_uuid, user_name,
+                                   host: str = "http://127.0.0.1:8000/"):
+    activate_url = f'{host}api/user/verify/{user_uuid}'
+    content = await render_template('email_verification.html', {'user': user_name, 'link': activate_url})
 
-async def send_email_order(user_email, user_name, order, cart):
-    file = 'templates/order_sender.html'
-    content = await render_template(file, {'user_name': user_name, 'order': order, 'cart': cart})
+    await dao.enqueue_email(session, recipients=[user_email], subject='Account verification', body=content)
 
-    send_email(
-        recipients=[user_email],
-        mail_body=content,
-        mail_subject=f'Order message'
-    )
 
+async def queue_email_order(session: AsyncSession, user_email, user_name, order, cart):
+    content = await render_template('order_sender.html', {'user_name': user_name, 'order': order, 'cart': cart})
 
+    await dao.enqueue_email(session, recipients=[user_email], subject='Order message', body=content)
@@ -0,0 +1,66 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from library import metrics
+from settings import settings
+
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+
+
+# bcrypt is CPU bound, so these run in worker processes and have to stay picklable module-level functions
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+class HashingExecutor:
+    pool_size = settings.HASHING_POOL_SIZE
+    queue_limit = settings.HASHING_QUEUE_LIMIT
+
+    _executor: ProcessPoolExecutor | None = None
+    _pending = 0
+
+    queue_depth = metrics.Gauge('password_hash_queue_depth', 'Hashing jobs submitted and not finished yet')
+    latency = metrics.Histogram('password_hash_seconds', 'Time to hash or verify a password, waiting included')
+    rejected = metrics.Counter('password_hash_rejected_total', 'Hashing jobs rejected because the queue was full')
+
+    @classmethod
+    def start(cls):
+        if cls._executor is None:
+            # workers start on demand while the app runs threads, so they must not be forked from it
+            cls._executor = ProcessPoolExecutor(max_workers=cls.pool_size,
+                                                mp_context=multiprocessing.get_context('forkserver'))
+
+    @classmethod
+    def shutdown(cls):
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @classmethod
+    async def run(cls, func, *args):
+        if cls._pending >= cls.queue_limit:
+            cls.rejected.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail='Server is busy, please try again later',
+                headers={'Retry-After': str(settings.HASHING_RETRY_AFTER_SECONDS)},
+            )
+        cls.start()
+        cls._pending += 1
+        cls.queue_depth.set(cls._pending)
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cls._executor, func, *args)
+        finally:
+            cls._pending -= 1
+            cls.queue_depth.set(cls._pending)
+            cls.latency.observe(time.perf_counter() - started)
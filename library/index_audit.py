@@ -0,0 +1,118 @@
+"""Report foreign key and DAO filter columns that no index can serve.
+
+Usage: python -m library.index_audit [path/to/dao.py ...]   (default: dao.py and statements.py)
+"""
+import ast
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterable
+
+from sqlalchemy import Column, Table, UniqueConstraint
+
+import models  # noqa: F401  registers the mappers on Base
+from database import Base
+
+QUERY_METHODS = {'filter', 'filter_by', 'where', 'join', 'outerjoin', 'having'}
+# the hottest DAO queries are built in statements.py, so both modules are checked
+DEFAULT_DAO_PATHS = (Path(__file__).parent.parent / 'dao.py', Path(__file__).parent.parent / 'statements.py')
+
+
+def _model_tables() -> dict[str, Table]:
+    return {mapper.class_.__name__: mapper.local_table for mapper in Base.registry.mappers}
+
+
+def indexed_columns(table: Table, include_partial: bool = True) -> set[str]:
+    """Columns that lead an index; partial indexes also cover the columns their WHERE clause tests."""
+    covered = set()
+    if table.primary_key.columns:
+        covered.add(list(table.primary_key.columns)[0].name)
+    for constraint in table.constraints:
+        columns = list(getattr(constraint, 'columns', []))
+        if columns and isinstance(constraint, UniqueConstraint):
+            covered.add(columns[0].name)
+    for index in table.indexes:
+        where = index.dialect_options['postgresql'].get('where')
+        if where is not None and not include_partial:
+            continue
+        expressions = list(index.expressions)
+        leading = expressions[0] if expressions else None
+        while leading is not None and not isinstance(leading, (Column, str)):
+            leading = getattr(leading, 'element', None)
+        if isinstance(leading, Column):
+            covered.add(leading.name)
+        elif isinstance(leading, str):
+            covered.add(leading)
+        if where is not None:
+            covered.update(name for name in table.columns.keys() if name in str(where))
+    return covered
+
+
+def _select_model(node: ast.AST, model_names: set[str]) -> str | None:
+    """Walk a method chain back to its select(Model) call."""
+    while isinstance(node, ast.Call) or isinstance(node, ast.Attribute):
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id == 'select':
+                first = node.args[0] if node.args else None
+                return first.id if isinstance(first, ast.Name) and first.id in model_names else None
+            node = node.func
+        else:
+            node = node.value
+    return None
+
+
+def filtered_columns(dao_path: Path, model_names: set[str]) -> list[tuple[str, set[str], str]]:
+    """(model, columns, DAO function) for every filter or join call in the DAO module."""
+    usages = []
+    tree = ast.parse(dao_path.read_text())
+    for function in ast.walk(tree):
+        if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        for call in ast.walk(function):
+            if not (isinstance(call, ast.Call) and isinstance(call.func, ast.Attribute)):
+                continue
+            if call.func.attr not in QUERY_METHODS:
+                continue
+            columns = defaultdict(set)
+            for argument in call.args:
+                for node in ast.walk(argument):
+                    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) \
+                            and node.value.id in model_names:
+                        columns[node.value.id].add(node.attr)
+            if call.func.attr == 'filter_by':
+                model = _select_model(call.func.value, model_names)
+                if model:
+                    columns[model].update(keyword.arg for keyword in call.keywords if keyword.arg)
+            usages.extend((model, names, function.name) for model, names in columns.items())
+    return usages
+
+
+def audit(dao_paths: Iterable[Path] = DEFAULT_DAO_PATHS) -> list[str]:
+    tables = _model_tables()
+    missing = defaultdict(set)
+
+    for table in tables.values():
+        covered = indexed_columns(table, include_partial=False)
+        for column in table.columns:
+            if column.foreign_keys and column.name not in covered:
+                missing[(table.name, column.name)].add('foreign key')
+
+    # a filter is fine as long as at least one of the columns it tests on that table is indexed
+    usages = [usage for dao_path in dao_paths for usage in filtered_columns(dao_path, set(tables))]
+    for model, column_names, function_name in usages:
+        table = tables[model]
+        column_names = {name for name in column_names if name in table.columns}
+        if column_names and not column_names & indexed_columns(table):
+            for column_name in column_names:
+                missing[(table.name, column_name)].add(f'{function_name}()')
+
+    return [f'{table}.{column}: {", ".join(sorted(reasons))}' for (table, column), reasons in sorted(missing.items())]
+
+
+if __name__ == '__main__':
+    report = audit([Path(path) for path in sys.argv[1:]] or DEFAULT_DAO_PATHS)
+    for line in report:
+        print(line)
+    if not report:
+        print('Every foreign key and filtered column is covered by an index')
+    sys.exit(1 if report else 0)
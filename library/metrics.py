@@ -0,0 +1,90 @@
+import threading
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def samples(self) -> list[tuple[str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name} {value}' for name, value in self.samples())
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str, description: str, buckets: tuple = default_buckets):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        with self._lock:
+            self.total += value
+            self.count += 1
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+
+    def samples(self) -> list[tuple[str, float]]:
+        samples = [(f'{self.name}_bucket{{le="{bound}"}}', count) for bound, count in zip(self.buckets, self.counts)]
+        samples.append((f'{self.name}_bucket{{le="+Inf"}}', self.count))
+        samples.append((f'{self.name}_sum', self.total))
+        samples.append((f'{self.name}_count', self.count))
+        return samples
+
+
+REGISTRY: list[Metric] = []
+
+
+def render_metrics() -> str:
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Hashable
+
+from library import metrics
+from library.cache import TTLCache
+from library.catalogue_cache import catalogue_cache
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PageCache:
+    """Rendered anonymous pages with stale-while-revalidate; an entry is whatever its render returned.
+
+    An entry is fresh for `ttl` seconds while the catalogue version it was rendered at is current. After that it is
+    still served for up to `stale_ttl` seconds while a single background render replaces it. Like the catalogue
+    cache, a page rendered from a replica is only stored once the last bump is READ_YOUR_WRITES_SECONDS old.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float, stale_ttl: float):
+        self.ttl = ttl
+        self._pages = TTLCache(name, max_size, ttl + stale_ttl)
+        self._refreshing: dict[Hashable, asyncio.Task] = {}
+        self.stale_served = metrics.Counter(f'{name}_stale_served_total', f'Stale {name} entries served during a refresh')
+
+    async def get_or_render(self, key: Hashable, render: Callable[[], Awaitable[Any]],
+                            revalidate: Callable[[], Awaitable[Any]], primary: bool = True) -> Any:
+        """`render` runs inline on a miss, `primary` tells whether it reads from the primary.
+
+        `revalidate` runs in the background and must open its own session on the primary.
+        """
+        entry = self._pages.get(key)
+        if entry is None:
+            return await self._render(key, render, primary)
+
+        version, rendered_at, body = entry
+        if version != catalogue_cache.version or time.monotonic() - rendered_at > self.ttl:
+            self.stale_served.inc()
+            if key not in self._refreshing:
+                task = asyncio.create_task(self._revalidate(key, revalidate))
+                self._refreshing[key] = task
+                task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+        return body
+
+    async def _render(self, key: Hashable, render: Callable[[], Awaitable[Any]], primary: bool) -> Any:
+        version, cacheable = catalogue_cache.version, catalogue_cache.accepts(primary)
+        body = await render()
+        if cacheable:
+            self._pages.set(key, (version, time.monotonic(), body))
+        return body
+
+    async def _revalidate(self, key: Hashable, render: Callable[[], Awaitable[Any]]):
+        try:
+            await self._render(key, render, primary=True)
+        except Exception:
+            logger.exception('Background render of %s failed, keeping the stale page', key)
+
+    def clear(self):
+        self._pages.clear()
+
+
+page_cache = PageCache(
+    'page',
+    max_size=settings.PAGE_CACHE_SIZE,
+    ttl=settings.PAGE_CACHE_TTL_SECONDS,
+    stale_ttl=settings.PAGE_CACHE_STALE_SECONDS,
+)
@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple
+
+from fastapi import HTTPException, status
+
+
+class Page(NamedTuple):
+    items: list[Any]
+    next_cursor: str | None
+
+
+class StreamedPage:
+    """Keyset page read row by row from an async result; `next_cursor` is only known once the rows are consumed.
+
+    Rows are taken from the result in partitions, and `prefetch` gets each partition before its rows are handed out,
+    so related data can be batch loaded alongside the stream.
+    """
+
+    def __init__(self, rows, limit: int, partition_size: int,
+                 prefetch: Callable[[list], Awaitable[Any]] | None = None):
+        self._rows = rows
+        self.limit = limit
+        self.partition_size = partition_size
+        self.prefetch = prefetch
+        self.next_cursor: str | None = None
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        count, last = 0, None
+        try:
+            async for partition in self._rows.partitions(self.partition_size):
+                partition = partition[:self.limit + 1 - count]
+                if self.prefetch:
+                    await self.prefetch(partition[:self.limit - count])
+                for item in partition:
+                    # the query asks for one extra row to learn whether there is a next page
+                    if count == self.limit:
+                        self.next_cursor = encode_cursor(last.created_at, last.id)
+                        return
+                    count, last = count + 1, item
+                    yield item
+        finally:
+            await self._rows.close()
+
+
+def encode_cursor(created_at: datetime | None, item_id: int) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, item_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        return (datetime.fromisoformat(created_at) if created_at else None), int(item_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
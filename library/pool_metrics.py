@@ -0,0 +1,65 @@
+import math
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from library import metrics
+from settings import settings
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    pool_metrics: 'PoolMetrics'
+
+    def connect(self):
+        started = time.perf_counter()
+        self.pool_metrics.waiting.inc()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.pool_metrics.checkout_timeouts.inc()
+            raise
+        finally:
+            self.pool_metrics.waiting.dec()
+            self.pool_metrics.record_wait(time.perf_counter() - started)
+
+
+class PoolMetrics:
+    """Saturation metrics for one engine's connection pool, exported with the given name prefix."""
+
+    wait_buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, prefix: str):
+        self.checked_out = metrics.Gauge(f'{prefix}_checked_out', 'Connections currently checked out of the pool')
+        self.overflow = metrics.Gauge(f'{prefix}_overflow', 'Connections open beyond pool_size')
+        self.checkout_wait = metrics.Histogram(
+            f'{prefix}_checkout_wait_seconds', 'Time spent waiting for a pooled connection', self.wait_buckets,
+        )
+        self.checkout_timeouts = metrics.Counter(f'{prefix}_checkout_timeouts_total', 'Checkouts that hit pool_timeout')
+        self.waiting = metrics.Gauge(f'{prefix}_checkout_waiting', 'Checkouts currently waiting for a connection')
+        self._recent_wait = 0.0
+        self._recent_wait_at = time.monotonic()
+        # a subclass per engine keeps the metrics attached when the engine recreates its pool on dispose()
+        self.pool_class = type('InstrumentedAsyncPool', (InstrumentedAsyncPool,), {'pool_metrics': self})
+
+    def record_wait(self, seconds: float):
+        self.checkout_wait.observe(seconds)
+        now = time.monotonic()
+        self._recent_wait = max(seconds, self.recent_wait(now))
+        self._recent_wait_at = now
+
+    def recent_wait(self, now: float | None = None) -> float:
+        """Worst recent checkout wait, halving every DB_POOL_WAIT_HALF_LIFE_SECONDS without a worse one."""
+        elapsed = (time.monotonic() if now is None else now) - self._recent_wait_at
+        return self._recent_wait * math.pow(0.5, elapsed / settings.DB_POOL_WAIT_HALF_LIFE_SECONDS)
+
+    def instrument(self, engine: AsyncEngine):
+        sync_engine = engine.sync_engine
+
+        def update(*args):
+            self.checked_out.set(sync_engine.pool.checkedout())
+            self.overflow.set(max(sync_engine.pool.overflow(), 0))
+
+        event.listen(sync_engine, 'checkout', update)
+        event.listen(sync_engine, 'checkin', update)
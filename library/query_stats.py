@@ -0,0 +1,117 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+@dataclass
+class RequestQueryStats:
+    scope: dict
+    count: int = 0
+    duration: float = 0.0
+    # statements counted when Server-Timing went out; a streamed body runs more after that
+    header_count: int | None = None
+    shapes: Counter = field(default_factory=Counter)
+
+    @property
+    def endpoint(self):
+        return self.scope.get('endpoint')
+
+    @property
+    def route(self) -> str:
+        endpoint = self.endpoint
+        return endpoint.__name__ if endpoint else self.scope.get('path', '')
+
+    def repeated_shapes(self) -> list[tuple[str, int]]:
+        return [(shape, times) for shape, times in self.shapes.items() if times >= settings.QUERY_N_PLUS_ONE_THRESHOLD]
+
+
+current_stats: ContextVar[RequestQueryStats | None] = ContextVar('current_query_stats', default=None)
+
+
+def query_budget(limit: int):
+    """Declare how many statements a route may run; enforced when QUERY_BUDGET_STRICT is on."""
+    def decorator(endpoint):
+        endpoint.query_budget = limit
+        return endpoint
+    return decorator
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    stats = current_stats.get()
+    if stats is None:
+        return
+    stats.count += 1
+    stats.duration += elapsed
+    stats.shapes[statement] += 1
+
+    if settings.QUERY_BUDGET_STRICT:
+        budget = getattr(stats.endpoint, 'query_budget', None)
+        if budget is not None and stats.count > budget:
+            raise QueryBudgetExceeded(f'{stats.route} ran {stats.count} statements, its budget is {budget}')
+        if stats.shapes[statement] >= settings.QUERY_N_PLUS_ONE_THRESHOLD:
+            raise QueryBudgetExceeded(f'{stats.route} repeated one statement {stats.shapes[statement]} times')
+
+
+def install(engine: AsyncEngine):
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """Counts statements and database time per request, reports them in Server-Timing and logs outliers.
+
+    Server-Timing is sent with the response start, so for streamed responses it only covers the statements run
+    before the body; the final counts of those requests are logged when they finish.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueryStats(scope=scope)
+        token = current_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                stats.header_count = stats.count
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', f'db;desc="{stats.count} queries";dur={stats.duration * 1000:.1f}'.encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_stats.reset(token)
+            self.report(stats)
+
+    @staticmethod
+    def report(stats: RequestQueryStats):
+        if stats.count > settings.QUERY_LOG_THRESHOLD:
+            logger.warning('%s ran %s statements in %.1f ms', stats.route, stats.count, stats.duration * 1000)
+        elif stats.header_count is not None and stats.count > stats.header_count:
+            logger.info('%s ran %s statements in %.1f ms, %s of them after Server-Timing was sent', stats.route,
+                        stats.count, stats.duration * 1000, stats.count - stats.header_count)
+        for shape, times in stats.repeated_shapes():
+            logger.warning('Possible N+1 in %s: statement repeated %s times: %s', stats.route, times, shape)
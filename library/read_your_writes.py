@@ -0,0 +1,35 @@
+from http.cookies import SimpleCookie
+
+from database import PRIMARY_UNTIL_COOKIE, request_writes
+from settings import settings
+
+
+class ReadYourWritesMiddleware:
+    """Sets a short-lived cookie after a request commits, pinning the client's reads to the primary."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        writes = {}
+        token = request_writes.set(writes)
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start' and 'primary_until' in writes:
+                cookie = SimpleCookie()
+                cookie[PRIMARY_UNTIL_COOKIE] = str(writes['primary_until'])
+                cookie[PRIMARY_UNTIL_COOKIE]['max-age'] = settings.READ_YOUR_WRITES_SECONDS
+                cookie[PRIMARY_UNTIL_COOKIE]['path'] = '/'
+                cookie[PRIMARY_UNTIL_COOKIE]['httponly'] = True
+                headers = list(message.get('headers', []))
+                headers.append((b'set-cookie', cookie.output(header='').strip().encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_writes.reset(token)
@@ -0,0 +1,25 @@
+import asyncio
+import logging
+
+import dao
+from database import async_session_maker
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def purge_expired_refresh_tokens():
+    """Delete expired refresh tokens in small, paced batches so the purge never turns into one huge delete."""
+    batch_size = settings.REFRESH_TOKEN_PURGE_BATCH_SIZE
+    while True:
+        try:
+            async with async_session_maker() as session:
+                deleted = await dao.delete_expired_refresh_tokens(session, batch_size)
+        except Exception:
+            logger.exception('Refresh token purge failed')
+            deleted = 0
+
+        if deleted >= batch_size:
+            await asyncio.sleep(settings.REFRESH_TOKEN_PURGE_BATCH_PAUSE_SECONDS)
+        else:
+            await asyncio.sleep(settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS)
@@ -1,9 +1,76 @@
+from pathlib import Path
+from typing import Callable
+
 import jinja2
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+
+from settings import settings
+
+TEMPLATES_DIR = Path(__file__).parent.parent / 'templates'
+
+
+def _environment_options(kind: str) -> dict:
+    # sync and async environments compile different code, so they must not share bytecode files
+    return {
+        'loader': jinja2.FileSystemLoader(TEMPLATES_DIR),
+        'bytecode_cache': jinja2.FileSystemBytecodeCache(
+            settings.TEMPLATE_BYTECODE_CACHE_DIR or None, f'__jinja2_{kind}_%s.cache',
+        ),
+        'auto_reload': settings.TEMPLATE_AUTO_RELOAD,
+        'cache_size': settings.TEMPLATE_CACHE_SIZE,
+        'autoescape': True,
+    }
+
+
+# pages are rendered through the Starlette wrapper, emails and streamed pages through the async environment
+templates = Jinja2Templates(directory=TEMPLATES_DIR, **_environment_options('sync'))
+async_env = jinja2.Environment(enable_async=True, **_environment_options('async'))
+async_env.globals['url_for'] = templates.env.globals['url_for']
+
+
+def relative_url_for(request) -> Callable[..., str]:
+    """`url_for` that renders root-relative paths instead of absolute URLs built from the Host header.
+
+    Pages shared between visitors must not depend on the host or scheme of whoever rendered them first.
+    """
+    app, root_path = request.app, request.scope.get('root_path', '')
+
+    def url_for(name: str, **path_params) -> str:
+        return root_path + app.url_path_for(name, **path_params)
+
+    return url_for
+
+
+def precompile_templates():
+    """Compile every template up front so the first request does not pay for parsing."""
+    for environment in (templates.env, async_env):
+        for name in environment.list_templates(extensions=['html']):
+            environment.get_template(name)
+
+
+async def render_template(template_name: str, data: dict) -> str:
+    return await async_env.get_template(template_name).render_async(data)
+
+
+def stream_template(template_name: str, context: dict, status_code: int = 200,
+                    headers: dict | None = None) -> StreamingResponse:
+    """Stream a page from the async environment: the head goes out at once, the rest in buffered chunks.
+
+    Loops in the template may iterate async results, so rows are rendered as the database returns them.
+    """
+    template = async_env.get_template(template_name)
 
+    async def body():
+        buffer, size, head_sent = [], 0, False
+        async for chunk in template.generate_async(context):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= settings.TEMPLATE_STREAM_BUFFER_SIZE or (not head_sent and '</head>' in chunk):
+                head_sent = True
+                yield ''.join(buffer).encode()
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer).encode()
 
-async def render_template(template_path, data):
-    templateLoader = jinja2.FileSystemLoader(searchpath="./")
-    templateEnv = jinja2.Environment(loader=templateLoader)
-    template = templateEnv.get_template(str(template_path))
-    outputText = template.render(data)  # this is where to put args to the template renderer
-    return outputText
+    return StreamingResponse(body(), status_code=status_code, headers=headers, media_type='text/html')
@@ -4,26 +4,26 @@ import jwt
 
 from fastapi import HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_async_session
 
 from api.schemas_user import LoginResponse
 import dao
+from library.cache import user_cache, token_cache
+from library.hashing import HashingExecutor, hash_password, verify_password
 from models import User
 from settings import settings
 
 
 class PasswordEncrypt:
-    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
     @classmethod
     async def get_password_hash(cls, password: str) -> str:
-        return cls.pwd_context.hash(password)
+        return await HashingExecutor.run(hash_password, password)
 
     @classmethod
     async def verify_password(cls, plain_password: str, hashed_password: str) -> bool:
-        return cls.pwd_context.verify(plain_password, hashed_password)
+        return await HashingExecutor.run(verify_password, plain_password, hashed_password)
 
 
 class AuthHandler:
@@ -55,10 +55,21 @@ class AuthHandler:
         token_ = jwt.encode(payload, cls.secret, cls.algorithm)
         return token_
 
+    @classmethod
+    def _decode_verified(cls, token: str) -> dict:
+        payload = token_cache.get_payload(token)
+        if payload is not None:
+            return payload
+        if token_cache.is_revoked(token):
+            raise jwt.InvalidTokenError('Token was revoked')
+        payload = jwt.decode(token, cls.secret, [cls.algorithm])
+        token_cache.add(token, payload)
+        return payload
+
     @classmethod
     async def decode_token(cls, token: str) -> dict:
         try:
-            payload = jwt.decode(token, cls.secret, [cls.algorithm])
+            payload = cls._decode_verified(token)
             return payload
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Time is out')
@@ -68,11 +79,15 @@ class AuthHandler:
     @classmethod
     async def decode_token_web(cls, token: str) -> dict:
         try:
-            payload = jwt.decode(token, cls.secret, [cls.algorithm])
+            payload = cls._decode_verified(token)
             return payload
         except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
             return {}
 
+    @classmethod
+    def revoke_token(cls, token: str, payload: dict | None = None):
+        token_cache.revoke(token, payload)
+
     @classmethod
     async def generate_token_pair(cls, user: User, session: AsyncSession) -> LoginResponse:
         access_token_payload = {
@@ -112,6 +127,7 @@ class AuthHandler:
         user_token.expires_at = datetime.utcnow()
         session.add(user_token)
         await session.commit()
+        cls.revoke_token(refresh_token, payload)
         token_pair = await cls.generate_token_pair(user_token.user, session)
         return token_pair
 
@@ -124,7 +140,7 @@ class SecurityHandler:
         cls, token: str = Depends(oauth2_scheme), session: AsyncSession = Depends(get_async_session)
     ):
         payload = await AuthHandler.decode_token(token)
-        user = await dao.get_user_by_email(email=payload.get('email'), session=session)
+        user = await cls.get_user_by_email(payload.get('email'), session)
         if user:
             return user
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='User unknown')
@@ -135,14 +151,34 @@ class SecurityHandler:
     ):
         token = request.cookies.get('token') or ''
         payload = await AuthHandler.decode_token_web(token)
-        user = await dao.get_user_by_email(email=payload.get('email'), session=session)
+        request.state.token_payload = payload
+        user = await cls.get_user_by_email(payload.get('email'), session)
         return user
 
     @classmethod
-    async def set_cookies_web(cls, user, response):
+    async def get_user_by_email(cls, email: str | None, session: AsyncSession) -> User | None:
+        if not email:
+            return None
+        user = user_cache.get(email)
+        if user is None:
+            user = await dao.get_user_by_email(email=email, session=session)
+            if user:
+                session.expunge(user)
+                user_cache.set(email, user)
+        return user
+
+    @classmethod
+    async def set_cookies_web(cls, user, response, token_payload: dict | None = None):
+        """Issue a fresh token cookie unless the current one is still far enough from expiry."""
         if not user:
             return response
 
+        if token_payload and token_payload.get('email') == user.email:
+            refresh_window = timedelta(minutes=settings.ACCESS_TOKEN_REFRESH_WINDOW_MINUTES)
+            expires_at = datetime.utcfromtimestamp(token_payload.get('exp', 0))
+            if expires_at - datetime.utcnow() > refresh_window:
+                return response
+
         access_token_payload = {
             'sub': user.id,
             'email': user.email,
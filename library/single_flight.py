@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+from library import metrics
+from settings import settings
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers with the same key wait for that call and share its result.
+
+    A follower that waits longer than the key's timeout, or whose leader was cancelled, makes the call itself.
+    Only use it for reads whose result is safe to hand to other requests, never for session-bound ORM instances.
+    """
+
+    def __init__(self, name: str, timeout: float):
+        self.timeout = timeout
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.coalesced = metrics.Counter(f'{name}_coalesced_total', f'{name} calls that shared an in-flight result')
+        self.timeouts = metrics.Counter(f'{name}_coalesce_timeouts_total',
+                                        f'{name} calls that gave up waiting for an in-flight result')
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]], timeout: float | None = None) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), self.timeout if timeout is None else timeout)
+                self.coalesced.inc()
+                return result
+            except asyncio.TimeoutError:
+                self.timeouts.inc()
+                return await func()
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                return await func()
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # mark it retrieved, nobody may be waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+
+read_flights = SingleFlight('dao_read', timeout=settings.SINGLE_FLIGHT_TIMEOUT_SECONDS)
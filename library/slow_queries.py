@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from greenlet import getcurrent
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from library.query_stats import current_stats
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SlowQueryRecord:
+    statement: str
+    parameters: list[str] | dict[str, str]
+    duration_ms: float
+    route: str
+    dao_function: str
+    recorded_at: datetime = field(default_factory=datetime.utcnow)
+    plan: str | None = None
+
+
+slow_queries: deque[SlowQueryRecord] = deque(maxlen=settings.SLOW_QUERY_BUFFER_SIZE)
+_explain_tasks: set[asyncio.Task] = set()
+
+
+def _redact(parameters) -> list[str] | dict[str, str]:
+    """Keep only the parameter types, values may hold emails, password hashes or tokens."""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+def _dao_function() -> str:
+    # the event runs in SQLAlchemy's worker greenlet, the awaiting DAO coroutine sits on the parent's stack
+    parent = getcurrent().parent
+    for frame in (sys._getframe(), parent.gr_frame if parent else None):
+        while frame is not None:
+            if frame.f_globals.get('__name__') == 'dao':
+                return frame.f_code.co_name
+            frame = frame.f_back
+    return ''
+
+
+async def _capture_plan(explain_engine: AsyncEngine, record: SlowQueryRecord, statement: str, parameters):
+    try:
+        async with explain_engine.connect() as connection:
+            result = await connection.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters)
+            record.plan = '\n'.join(row[0] for row in result)
+            await connection.rollback()
+    except Exception:
+        logger.exception('Could not capture a plan for a slow query')
+
+
+def install(engine: AsyncEngine):
+    explain_engine = None
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        nonlocal explain_engine
+        duration_ms = (time.perf_counter() - context._slow_query_started) * 1000
+        if duration_ms < settings.SLOW_QUERY_THRESHOLD_MS:
+            return
+
+        stats = current_stats.get()
+        record = SlowQueryRecord(
+            statement=statement,
+            parameters=_redact(parameters),
+            duration_ms=round(duration_ms, 2),
+            route=stats.route if stats else '',
+            dao_function=_dao_function(),
+        )
+        slow_queries.append(record)
+        logger.warning('Slow query (%.1f ms) in %s/%s: %s', duration_ms, record.route, record.dao_function, statement)
+
+        # EXPLAIN ANALYZE runs the statement again, so only plain reads are explained
+        if not settings.SLOW_QUERY_EXPLAIN or executemany or not statement.lstrip().upper().startswith('SELECT'):
+            return
+        if len(_explain_tasks) >= settings.SLOW_QUERY_MAX_PENDING_EXPLAINS:
+            return
+        if explain_engine is None:
+            explain_engine = create_async_engine(engine.url, poolclass=NullPool)
+        task = asyncio.get_running_loop().create_task(_capture_plan(explain_engine, record, statement, parameters))
+        _explain_tasks.add(task)
+        task.add_done_callback(_explain_tasks.discard)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', after_cursor_execute)
@@ -1,8 +1,20 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 import sentry_sdk
+from starlette.routing import Mount
 
-from api import api_router_user, general_routers, api_router_auth
+from api import api_router_user, general_routers, api_router_auth, metrics_router, admin_routers
+from library.admission import AdmissionMiddleware, Priority, admission
+from library.catalogue_cache import listen_for_catalogue_changes
+from library.email_outbox import deliver_outbox
+from library.hashing import HashingExecutor
+from library.query_stats import QueryStatsMiddleware
+from library.read_your_writes import ReadYourWritesMiddleware
+from library.render import precompile_templates
+from library.refresh_token_gc import purge_expired_refresh_tokens
 from web import web_router
 
 sentry_sdk.init(
@@ -10,7 +22,30 @@ sentry_sdk.init(
     traces_sample_rate=1.0,
     profiles_sample_rate=1.0,
 )
-app = FastAPI()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    HashingExecutor.start()
+    precompile_templates()
+    background_tasks = [
+        asyncio.create_task(purge_expired_refresh_tokens()),
+        asyncio.create_task(listen_for_catalogue_changes()),
+        asyncio.create_task(deliver_outbox()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    HashingExecutor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+# added last so it runs first and sheds load before any other work
+app.add_middleware(AdmissionMiddleware)
 
 app.mount('/static', StaticFiles(directory='static'), name='static')
 app.mount('/static/product_images', StaticFiles(directory='static/product_images'), name='product_images')
@@ -18,10 +53,30 @@ app.mount('/static/product_images', StaticFiles(directory='static/product_images
 app.include_router(api_router_user.router)
 app.include_router(general_routers.router_public)
 app.include_router(general_routers.router_private)
+app.include_router(general_routers.router_comments)
 app.include_router(api_router_auth.public_router)
+app.include_router(metrics_router.router)
+app.include_router(admin_routers.router_admin)
 
 app.include_router(web_router.web_router)
 
+admission.exempt(*(route for route in app.routes if isinstance(route, Mount)))
+admission.assign(api_router_user.router, Priority.CRITICAL)
+admission.assign(api_router_auth.public_router, Priority.CRITICAL)
+admission.assign(metrics_router.router, Priority.CRITICAL)
+admission.assign(general_routers.router_public, Priority.LOW)
+admission.assign(general_routers.router_comments, Priority.LOW)
+admission.assign(
+    web_router.web_router, Priority.NORMAL, anonymous=Priority.LOW,
+    paths={
+        '/close-order': Priority.CRITICAL,
+        '/login': Priority.CRITICAL,
+        '/signup': Priority.CRITICAL,
+        '/logout': Priority.CRITICAL,
+        '/get-reviews': Priority.LOW,
+    },
+)
+
 if __name__ == '__main__':
     import uvicorn
     uvicorn.run('main:app', reload=True, host='127.0.0.1', port=9000)
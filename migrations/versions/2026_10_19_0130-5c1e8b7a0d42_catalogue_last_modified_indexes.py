@@ -0,0 +1,29 @@
+"""catalogue-last-modified-indexes
+
+Revision ID: 5c1e8b7a0d42
+Revises: 3f8a6c2d9e71
+Create Date: 2026-10-19 01:30:12.804517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e8b7a0d42'
+down_revision: Union[str, None] = '3f8a6c2d9e71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # plain indexes, so max(created_at) and max(deleted_at) are single index lookups
+    op.create_index('ix_products_created_at', 'products', ['created_at'], unique=False)
+    op.create_index(op.f('ix_products_deleted_at'), 'products', ['deleted_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_products_deleted_at'), table_name='products')
+    op.drop_index('ix_products_created_at', table_name='products')
@@ -2,7 +2,8 @@ from datetime import datetime
 from typing import Optional
 import uuid
 
-from sqlalchemy import String, ForeignKey, UUID
+from sqlalchemy import String, Text, ForeignKey, UUID, Index, Computed, UniqueConstraint, text
+from sqlalchemy.dialects.postgresql import TSVECTOR, ARRAY
 from sqlalchemy.orm import Mapped, relationship
 from sqlalchemy.orm import mapped_column
 
@@ -20,11 +21,14 @@ class Comments(BaseInfoMixin, Base):
     __tablename__ = "comments"
 
     text_review: Mapped[str] = mapped_column(String(250), nullable=False)
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-    created_at: Mapped[Optional[datetime]] = mapped_column(default=None)
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), index=True)
 
     comments = relationship('User', back_populates='comments')
 
+    __table_args__ = (
+        Index('ix_comments_created_at_id', 'created_at', 'id'),
+    )
+
 
 class User(BaseInfoMixin, Base):
     __tablename__ = "users"
@@ -32,7 +36,7 @@ class User(BaseInfoMixin, Base):
     name: Mapped[str] = mapped_column(String(50), index=True)
     email: Mapped[str] = mapped_column(String(150), unique=True, index=True)
     hashed_password: Mapped[str]
-    user_uuid: Mapped[uuid.UUID] = mapped_column(default=uuid.uuid4)
+    user_uuid: Mapped[uuid.UUID] = mapped_column(default=uuid.uuid4, index=True)
     is_active: Mapped[bool] = mapped_column(default=True)
     verified_at: Mapped[bool] = mapped_column(default=False)
     is_admin: Mapped[bool] = mapped_column(default=False, nullable=True)
@@ -49,11 +53,15 @@ class UserRefreshToken(BaseInfoMixin, Base):
     __tablename__ = 'refresh_tokens'
 
     user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
-    refresh_key: Mapped[str]
-    expires_at: Mapped[datetime]
+    refresh_key: Mapped[str] = mapped_column(index=True)
+    expires_at: Mapped[datetime] = mapped_column(index=True)
 
     user = relationship('User', back_populates='tokens')
 
+    __table_args__ = (
+        Index('ix_refresh_tokens_user_id_expires_at', 'user_id', 'expires_at'),
+    )
+
 
 class Product(BaseInfoMixin, Base):
     __tablename__ = 'products'
@@ -62,10 +70,21 @@ class Product(BaseInfoMixin, Base):
     price: Mapped[float]
     image_url: Mapped[str] = mapped_column(default='', nullable=True)
     image_file: Mapped[str] = mapped_column(default='', nullable=True)
-    deleted_at: Mapped[Optional[datetime]] = mapped_column(default=None)
+    deleted_at: Mapped[Optional[datetime]] = mapped_column(default=None, index=True)
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR, Computed("to_tsvector('simple', coalesce(title, ''))", persisted=True), deferred=True,
+    )
 
     products = relationship('OrderProduct', back_populates='product')
 
+    __table_args__ = (
+        Index('ix_products_created_at_id', 'created_at', 'id', postgresql_where=text('deleted_at IS NULL')),
+        # max(created_at) and max(deleted_at) over all rows, for the catalogue Last-Modified
+        Index('ix_products_created_at', 'created_at'),
+        Index('ix_products_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_products_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
+
     def __str__(self):
         return f'Product {self.title} - #{self.id}'
 
@@ -73,23 +92,48 @@ class Product(BaseInfoMixin, Base):
 class Order(BaseInfoMixin, Base):
     __tablename__ = 'orders'
 
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'), index=True)
     is_closed: Mapped[bool] = mapped_column(default=False)
 
     user = relationship('User', back_populates='orders', lazy=False)
 
+    __table_args__ = (
+        Index('uq_orders_user_id_open', 'user_id', unique=True, postgresql_where=text('NOT is_closed')),
+    )
+
 
 class OrderProduct(BaseInfoMixin, Base):
     __tablename__ = 'order_products'
 
     order_id: Mapped[int] = mapped_column(ForeignKey('orders.id'))
-    product_id: Mapped[int] = mapped_column(ForeignKey('products.id'))
+    product_id: Mapped[int] = mapped_column(ForeignKey('products.id'), index=True)
     price: Mapped[float] = mapped_column(default=0.0)
     quantity: Mapped[int] = mapped_column(default=0)
 
     product = relationship('Product', back_populates='products')
 
+    __table_args__ = (
+        UniqueConstraint('order_id', 'product_id', name='uq_order_products_order_id_product_id'),
+    )
+
     def __str__(self):
         return f'OrderProduct {self.product.title} - #{self.id}, {self.quantity} >> {self.price} = {self.quantity * self.price}'
 
     __repr__ = __str__
+
+
+class EmailOutbox(BaseInfoMixin, Base):
+    __tablename__ = 'email_outbox'
+
+    recipients: Mapped[list[str]] = mapped_column(ARRAY(String(150)))
+    subject: Mapped[str] = mapped_column(String(250))
+    body: Mapped[str] = mapped_column(Text)
+    mime_type: Mapped[str] = mapped_column(String(20), default='html')
+    attempts: Mapped[int] = mapped_column(default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]]
+    last_error: Mapped[Optional[str]]
+
+    __table_args__ = (
+        Index('ix_email_outbox_next_attempt_at_pending', 'next_attempt_at', postgresql_where=text('sent_at IS NULL')),
+    )
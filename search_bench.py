@@ -0,0 +1,91 @@
+"""Benchmark for product search: dao.search_products against the old `ILIKE '%q%'` filter on a seeded catalogue.
+
+Runs against the DATABASE_* settings (.env) with the migrations applied; `seed` appends rows to `products`,
+so point it at a scratch database.
+Usage: python -m search_bench seed [rows]     (default 1000000)
+       python -m search_bench run [repeats]    (default 20)
+"""
+import asyncio
+import sys
+import time
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import dao
+from models import Product
+from settings import settings
+
+SEED = text("""
+    INSERT INTO products (title, price, image_url, image_file, created_at)
+    SELECT
+        (ARRAY['Nike', 'Adidas', 'Puma', 'Reebok', 'Asics', 'New Balance', 'Vans', 'Converse'])[1 + n % 8]
+        || ' ' || (ARRAY['Air', 'Runner', 'Classic', 'Court', 'Trail', 'Max', 'Zoom', 'Street', 'Boost', 'Wave'])
+                  [1 + (n / 8) % 10]
+        || ' ' || n,
+        round((20 + random() * 180)::numeric, 2), '', '', now() - n * interval '1 second'
+    FROM generate_series(1, :rows) AS n
+""")
+
+# query shape -> search term
+QUERIES = {
+    'prefix': 'Conv',
+    'substring': 'unne',
+    'short (<3 chars)': 'ai',
+    'no match': 'xyzzy',
+}
+
+
+async def ilike_products(session: AsyncSession, q: str, limit: int = 12) -> list[Product]:
+    """The search before the tsvector and trigram indexes: an unranked `ILIKE '%q%'` filter."""
+    query = select(Product).filter(Product.title.icontains(q), Product.deleted_at == None).limit(limit)
+    result = await session.execute(query)
+    return result.scalars().all()
+
+
+async def measure(session: AsyncSession, search, q: str, repeats: int) -> tuple[float, int]:
+    """Best wall time in milliseconds over `repeats` runs, plus the number of rows returned."""
+    found = await search(session, q)  # warm the plan and buffer caches
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await search(session, q)
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1e3, len(found)
+
+
+async def seed(session: AsyncSession, rows: int):
+    await session.execute(SEED, {'rows': rows})
+    # so the planner sees the new rows before the first run
+    await session.execute(text('ANALYZE products'))
+    await session.commit()
+
+
+async def run(session: AsyncSession, repeats: int):
+    total = await session.scalar(text('SELECT count(*) FROM products'))
+    print(f'{total} products, best of {repeats}')
+    print(f'{"query":<18}{"term":<8}{"ILIKE ms":>10}{"rows":>6}{"search ms":>11}{"rows":>6}{"speedup":>10}')
+    for shape, q in QUERIES.items():
+        ilike_ms, ilike_rows = await measure(session, ilike_products, q, repeats)
+        search_ms, search_rows = await measure(session, dao.search_products, q, repeats)
+        print(f'{shape:<18}{q:<8}{ilike_ms:>10.1f}{ilike_rows:>6}{search_ms:>11.1f}{search_rows:>6}'
+              f'{ilike_ms / search_ms:>9.1f}x')
+
+
+async def main(command: str, argument: int | None):
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    try:
+        async with async_sessionmaker(engine)() as session:
+            if command == 'seed':
+                await seed(session, argument or 1_000_000)
+            else:
+                await run(session, argument or 20)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('seed', 'run'):
+        sys.exit(__doc__)
+    asyncio.run(main(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None))
@@ -11,14 +11,97 @@ class Settings:
     DATABASE_HOST = os.getenv('DATABASE_HOST', '')
     DATABASE_PORT = os.getenv('DATABASE_PORT', '')
 
+    # comma separated postgresql+asyncpg:// URLs of read replicas, empty means everything goes to the primary
+    DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+    READ_YOUR_WRITES_SECONDS = int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() in ('1', 'true', 'yes')
+    DB_POOL_WAIT_HALF_LIFE_SECONDS = float(os.getenv('DB_POOL_WAIT_HALF_LIFE_SECONDS', 5))
+    # per-connection asyncpg prepared statements; the lambda statements in statements.py render stable SQL,
+    # so this only has to hold every distinct query the app issues
+    DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 256))
+    # rows taken from a server-side cursor at a time when a page is streamed
+    DB_STREAM_PARTITION_SIZE = int(os.getenv('DB_STREAM_PARTITION_SIZE', 64))
+
+    QUERY_LOG_THRESHOLD = int(os.getenv('QUERY_LOG_THRESHOLD', 10))
+    QUERY_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_N_PLUS_ONE_THRESHOLD', 5))
+    # fail requests that exceed their declared query budget, meant for tests
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'false').lower() in ('1', 'true', 'yes')
+
+    SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+    SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', 200))
+    SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes')
+    SLOW_QUERY_MAX_PENDING_EXPLAINS = int(os.getenv('SLOW_QUERY_MAX_PENDING_EXPLAINS', 2))
+
+    CATALOGUE_CACHE_SIZE = int(os.getenv('CATALOGUE_CACHE_SIZE', 256))
+    CATALOGUE_CACHE_TTL_SECONDS = int(os.getenv('CATALOGUE_CACHE_TTL_SECONDS', 300))
+    # LISTEN/NOTIFY channel shared by all workers, empty disables cross-worker invalidation
+    CATALOGUE_NOTIFY_CHANNEL = os.getenv('CATALOGUE_NOTIFY_CHANNEL', '')
+    CATALOGUE_LISTEN_CHECK_SECONDS = float(os.getenv('CATALOGUE_LISTEN_CHECK_SECONDS', 5))
+
+    # how long a read waits for an identical in-flight read before running its own query
+    SINGLE_FLIGHT_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_TIMEOUT_SECONDS', 5))
+    SINGLE_FLIGHT_SEARCH_TIMEOUT_SECONDS = float(os.getenv('SINGLE_FLIGHT_SEARCH_TIMEOUT_SECONDS', 10))
+
+    # requests in flight per worker before critical routes are refused too
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 200))
+    # share of ADMISSION_MAX_IN_FLIGHT normal and low priority requests may use, the rest is headroom
+    ADMISSION_NORMAL_SHARE = float(os.getenv('ADMISSION_NORMAL_SHARE', 0.8))
+    ADMISSION_LOW_SHARE = float(os.getenv('ADMISSION_LOW_SHARE', 0.5))
+    ADMISSION_NORMAL_MAX_POOL_WAIT_SECONDS = float(os.getenv('ADMISSION_NORMAL_MAX_POOL_WAIT_SECONDS', 1))
+    ADMISSION_LOW_MAX_POOL_WAIT_SECONDS = float(os.getenv('ADMISSION_LOW_MAX_POOL_WAIT_SECONDS', 0.2))
+    ADMISSION_NORMAL_MAX_POOL_WAITERS = int(os.getenv('ADMISSION_NORMAL_MAX_POOL_WAITERS', 20))
+    ADMISSION_LOW_MAX_POOL_WAITERS = int(os.getenv('ADMISSION_LOW_MAX_POOL_WAITERS', 5))
+    ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER_SECONDS', 2))
+
+    PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 128))
+    PAGE_CACHE_TTL_SECONDS = int(os.getenv('PAGE_CACHE_TTL_SECONDS', 30))
+    PAGE_CACHE_STALE_SECONDS = int(os.getenv('PAGE_CACHE_STALE_SECONDS', 300))
+
+    # empty keeps Jinja's default per-user directory under the system temp dir
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv('TEMPLATE_BYTECODE_CACHE_DIR', '')
+    TEMPLATE_CACHE_SIZE = int(os.getenv('TEMPLATE_CACHE_SIZE', 400))
+    # re-check template files on every render, only useful while editing them
+    TEMPLATE_AUTO_RELOAD = os.getenv('TEMPLATE_AUTO_RELOAD', 'false').lower() in ('1', 'true', 'yes')
+    TEMPLATE_STREAM_BUFFER_SIZE = int(os.getenv('TEMPLATE_STREAM_BUFFER_SIZE', 16 * 1024))
+
     SMTP_SERVER = os.getenv('SMTP_SERVER', '')
     EMAIL_TOKEN = os.getenv('EMAIL_TOKEN', '')
     EMAIL_USER = os.getenv('EMAIL_USER', '')
+    # plain SMTP without TLS, for a local stand-in server
+    SMTP_USE_SSL = os.getenv('SMTP_USE_SSL', 'true').lower() in ('1', 'true', 'yes')
+    SMTP_TIMEOUT_SECONDS = float(os.getenv('SMTP_TIMEOUT_SECONDS', 30))
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 20))
+    EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', 2))
+    EMAIL_OUTBOX_LEASE_SECONDS = float(os.getenv('EMAIL_OUTBOX_LEASE_SECONDS', 300))
+    EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', 8))
+    EMAIL_RETRY_BASE_SECONDS = float(os.getenv('EMAIL_RETRY_BASE_SECONDS', 30))
+    EMAIL_RETRY_MAX_SECONDS = float(os.getenv('EMAIL_RETRY_MAX_SECONDS', 3600))
 
     JWT_SECRET = os.getenv('JWT_SECRET', '')
     JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', '')
     REFRESH_TOKEN_TIME_MINUTES = 60 * 24  # one day
+    REFRESH_TOKEN_PURGE_BATCH_SIZE = int(os.getenv('REFRESH_TOKEN_PURGE_BATCH_SIZE', 500))
+    REFRESH_TOKEN_PURGE_BATCH_PAUSE_SECONDS = float(os.getenv('REFRESH_TOKEN_PURGE_BATCH_PAUSE_SECONDS', 1))
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS = float(os.getenv('REFRESH_TOKEN_PURGE_INTERVAL_SECONDS', 600))
     ACCESS_TOKEN_TIME_MINUTES = 50
+    # the web cookie is re-issued only when it has less than this many minutes left
+    ACCESS_TOKEN_REFRESH_WINDOW_MINUTES = int(os.getenv('ACCESS_TOKEN_REFRESH_WINDOW_MINUTES', 10))
+
+    HASHING_POOL_SIZE = int(os.getenv('HASHING_POOL_SIZE', 2))
+    HASHING_QUEUE_LIMIT = int(os.getenv('HASHING_QUEUE_LIMIT', 32))
+    HASHING_RETRY_AFTER_SECONDS = int(os.getenv('HASHING_RETRY_AFTER_SECONDS', 1))
+
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 60))
+    # revoked tokens are remembered per process until they expire; another worker, or this one after a restart,
+    # still accepts a logged-out access token until its `exp`, so revocation is best-effort
+    TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+    TOKEN_CACHE_TTL_SECONDS = int(os.getenv('TOKEN_CACHE_TTL_SECONDS', 300))
 
     @property
     def DATABASE_URL(self) -> str:
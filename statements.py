@@ -0,0 +1,36 @@
+"""Pre-built statements for the hottest DAO queries.
+
+Each factory returns a lambda statement: SQLAlchemy caches the construct and its compiled SQL by the
+lambda's code location, and values taken from the closure are extracted as bound parameters, so
+a call only pays for parameter extraction instead of rebuilding and re-keying the select().
+"""
+from datetime import datetime
+
+from sqlalchemy import lambda_stmt, select, tuple_
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+
+from models import User, Product, Order, OrderProduct
+
+
+def user_by_email(email: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.email == email))
+
+
+def product_page(after: tuple[datetime, int] | None, fetch_limit: int) -> StatementLambdaElement:
+    query = lambda_stmt(lambda: select(Product).where(Product.deleted_at == None))
+    if after:
+        created_at, product_id = after
+        query += lambda s: s.where(tuple_(Product.created_at, Product.id) < tuple_(created_at, product_id))
+    query += lambda s: s.order_by(Product.created_at.desc(), Product.id.desc()).limit(fetch_limit)
+    return query
+
+
+def order_products(order_id: int) -> StatementLambdaElement:
+    return lambda_stmt(
+        lambda: select(OrderProduct)
+        .where(OrderProduct.order_id == order_id, OrderProduct.quantity > 0, OrderProduct.price > 0)
+    )
+
+
+def open_order(user_id: int) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(Order).where(Order.user_id == user_id, Order.is_closed == False))
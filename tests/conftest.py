@@ -0,0 +1,55 @@
+"""Tests that need PostgreSQL run against the DATABASE_* settings and are skipped when it is unreachable."""
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# defaults match the db service in docker-compose.yml
+for name, value in {
+    'DATABASE_HOST': 'localhost',
+    'DATABASE_PORT': '5433',
+    'DATABASE_USER': 'postgres',
+    'DATABASE_PASSWORD': 'postgres',
+    'DATABASE_NAME': 'postgres',
+    'JWT_SECRET': 'test-secret',
+    'JWT_ALGORITHM': 'HS256',
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from settings import settings
+
+
+def run_on_database(func):
+    """Run `await func(session)` on a throwaway engine, so the app's pool never sees the test's event loop."""
+    async def run():
+        side_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+        try:
+            async with async_sessionmaker(side_engine, expire_on_commit=False)() as session:
+                return await func(session)
+        finally:
+            await side_engine.dispose()
+    return asyncio.run(run())
+
+
+@pytest.fixture(scope='session')
+def database():
+    import models  # noqa: F401  registers the tables on Base
+    from database import Base
+
+    async def create_schema(session):
+        await session.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        await session.run_sync(lambda sync_session: Base.metadata.create_all(sync_session.connection()))
+        await session.commit()
+
+    try:
+        run_on_database(create_schema)
+    except (OSError, DBAPIError) as error:
+        pytest.skip(f'PostgreSQL is not reachable: {error}')
+    return run_on_database
@@ -0,0 +1,71 @@
+"""Right after a catalogue write only primary reads may fill the cache, and primary readers never wait on replicas."""
+import asyncio
+import datetime
+
+import pytest
+from sqlalchemy.orm import Session
+
+import dao
+from database import PrimarySession
+from library.catalogue_cache import catalogue_cache
+
+OLD = datetime.datetime(2024, 1, 1)
+NEW = datetime.datetime(2024, 2, 1)
+
+
+class StubSession:
+    """Answers the last-modified query with a fixed value, optionally only once `release` is set."""
+
+    def __init__(self, primary: bool, last_modified: datetime.datetime, release: asyncio.Event | None = None):
+        self.sync_session = PrimarySession() if primary else Session()
+        self.last_modified = last_modified
+        self.release = release
+        self.queries = 0
+
+    async def execute(self, query):
+        self.queries += 1
+        if self.release is not None:
+            await self.release.wait()
+        return self
+
+    def scalar(self):
+        return self.last_modified
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalogue():
+    catalogue_cache.bump()
+    yield
+    catalogue_cache.bump()
+
+
+def test_lagging_replica_is_not_cached_after_a_bump():
+    replica, primary = StubSession(False, OLD), StubSession(True, NEW)
+
+    assert asyncio.run(dao.get_catalogue_last_modified(replica)) == OLD
+    assert asyncio.run(dao.get_catalogue_last_modified(primary)) == NEW
+    assert asyncio.run(dao.get_catalogue_last_modified(replica)) == NEW
+    assert replica.queries == 1
+
+
+def test_replica_reads_are_cached_once_the_bump_is_old(monkeypatch):
+    monkeypatch.setattr(catalogue_cache, 'bumped_at', float('-inf'))
+    replica = StubSession(False, NEW)
+
+    asyncio.run(dao.get_catalogue_last_modified(replica))
+    asyncio.run(dao.get_catalogue_last_modified(replica))
+
+    assert replica.queries == 1
+
+
+def test_primary_reader_does_not_share_a_replica_read():
+    async def run():
+        release = asyncio.Event()
+        replica = asyncio.create_task(dao.get_catalogue_last_modified(StubSession(False, OLD, release)))
+        await asyncio.sleep(0)
+        # a follower of the replica call would wait for it until the single-flight timeout
+        primary = await asyncio.wait_for(dao.get_catalogue_last_modified(StubSession(True, NEW)), 1)
+        release.set()
+        return primary, await replica
+
+    assert asyncio.run(run()) == (NEW, OLD)
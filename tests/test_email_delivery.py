@@ -0,0 +1,105 @@
+"""Outbox batches go over one SMTP session against a local aiosmtpd server, so no database or real mailbox is needed."""
+import asyncio
+import smtplib
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from library.email_outbox import _send_batch
+from library.email_sender import SMTPConnection, queue_email_verification
+from models import EmailOutbox
+from settings import settings
+
+
+class RecordingHandler:
+    """Keeps every accepted message with the connection it came over; refuses mail to `reject@example.com`."""
+
+    def __init__(self):
+        self.messages = []
+        self.peers = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.peers.append(session.peer)
+        if 'reject@example.com' in envelope.rcpt_tos:
+            return '550 Mailbox unavailable'
+        self.messages.append(envelope.rcpt_tos)
+        return '250 Message accepted for delivery'
+
+    @property
+    def connections(self) -> int:
+        return len(set(self.peers))
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=_free_port())
+    controller.start()
+    monkeypatch.setattr(settings, 'SMTP_SERVER', f'127.0.0.1:{controller.port}')
+    monkeypatch.setattr(settings, 'SMTP_USE_SSL', False)
+    monkeypatch.setattr(settings, 'SMTP_TIMEOUT_SECONDS', 5.0)
+    monkeypatch.setattr(settings, 'EMAIL_USER', '')
+    monkeypatch.setattr(settings, 'EMAIL_TOKEN', '')
+    yield handler
+    controller.stop()
+
+
+def outbox_email(email_id: int, recipient: str) -> EmailOutbox:
+    return EmailOutbox(id=email_id, recipients=[recipient], subject=f'Message {email_id}', body='<p>Hi</p>',
+                       mime_type='html', attempts=0)
+
+
+def test_batch_shares_one_connection(smtp_server):
+    connection = SMTPConnection()
+    emails = [outbox_email(email_id, f'user{email_id}@example.com') for email_id in (1, 2, 3)]
+
+    sent, failed = _send_batch(connection, emails)
+    connection.close()
+
+    assert sent == [1, 2, 3]
+    assert failed == []
+    assert smtp_server.messages == [[f'user{n}@example.com'] for n in (1, 2, 3)]
+    assert smtp_server.connections == 1
+
+
+def test_failed_quit_does_not_abort_batch(smtp_server, monkeypatch):
+    def broken_quit(self):
+        raise ConnectionResetError('connection reset by peer')
+
+    monkeypatch.setattr(smtplib.SMTP, 'quit', broken_quit)
+    connection = SMTPConnection()
+    emails = [outbox_email(1, 'user1@example.com'), outbox_email(2, 'reject@example.com'),
+              outbox_email(3, 'user3@example.com')]
+
+    sent, failed = _send_batch(connection, emails)
+    connection.close()
+
+    assert sent == [1, 3]
+    assert [email.id for email, _ in failed] == [2]
+    assert len(smtp_server.messages) == 2
+    # the refused message dropped the session, so the last one went over a fresh connection
+    assert smtp_server.connections == 2
+
+
+def test_verification_email_escapes_the_user_name():
+    class Session:
+        def __init__(self):
+            self.added = []
+
+        def add(self, instance):
+            self.added.append(instance)
+
+    session = Session()
+    asyncio.run(queue_email_verification(session, 'user@example.com', 'abc-123', '<script>alert(1)</script>'))
+
+    [email] = session.added
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in email.body
+    assert '<script>' not in email.body
+    assert 'href="http://127.0.0.1:8000/api/user/verify/abc-123"' in email.body
@@ -0,0 +1,137 @@
+"""The outbox table: leasing, completion, retries with backoff, and enqueueing inside the caller's transaction."""
+import datetime
+
+import pytest
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import dao
+from library.email_outbox import retry_delay
+from models import EmailOutbox
+from settings import settings
+
+LEASE = 300
+
+
+@pytest.fixture
+def outbox(database):
+    async def clear(session):
+        await session.execute(delete(EmailOutbox))
+        await session.commit()
+
+    database(clear)
+    yield database
+    database(clear)
+
+
+async def _enqueue(session, count: int, **values) -> list[int]:
+    emails = [await dao.enqueue_email(session, recipients=[f'user{n}@example.com'], subject=f'Message {n}', body='Hi')
+              for n in range(count)]
+    await session.flush()
+    if values:
+        await session.execute(update(EmailOutbox).where(EmailOutbox.id.in_([email.id for email in emails]))
+                              .values(**values))
+    await session.commit()
+    return [email.id for email in emails]
+
+
+async def _row(session, email_id: int) -> EmailOutbox:
+    return (await session.execute(
+        select(EmailOutbox).where(EmailOutbox.id == email_id).execution_options(populate_existing=True)
+    )).scalar_one()
+
+
+def test_claim_leases_each_due_email_once(outbox):
+    async def run(session):
+        ids = await _enqueue(session, 3)
+        first = await dao.claim_outbox_emails(session, 2, LEASE)
+        second = await dao.claim_outbox_emails(session, 2, LEASE)
+        third = await dao.claim_outbox_emails(session, 2, LEASE)
+        leased_until = (await _row(session, ids[0])).next_attempt_at
+        return ids, first, second, third, leased_until
+
+    ids, first, second, third, leased_until = outbox(run)
+
+    assert sorted(email.id for email in first + second) == ids
+    assert (len(first), len(second), third) == (2, 1, [])
+    assert leased_until > datetime.datetime.utcnow() + datetime.timedelta(seconds=LEASE - 60)
+
+
+def test_claim_skips_rows_locked_by_another_worker(outbox):
+    async def run(session):
+        ids = await _enqueue(session, 3)
+        async with async_sessionmaker(session.bind)() as other_worker:
+            # a worker still inside its claim transaction holds row locks on what it picked
+            await other_worker.execute(select(EmailOutbox).where(EmailOutbox.id == ids[0]).with_for_update())
+            claimed = await dao.claim_outbox_emails(session, 10, LEASE)
+            await other_worker.rollback()
+        return ids, claimed
+
+    ids, claimed = outbox(run)
+
+    assert sorted(email.id for email in claimed) == ids[1:]
+
+
+def test_sent_emails_are_not_claimed_again(outbox):
+    async def run(session):
+        ids = await _enqueue(session, 2)
+        # a zero lease makes every unsent email due again immediately
+        claimed = await dao.claim_outbox_emails(session, 10, 0)
+        await dao.mark_emails_sent(session, [ids[0]])
+        sent = await _row(session, ids[0])
+        return ids, claimed, sent.sent_at, await dao.claim_outbox_emails(session, 10, 0)
+
+    ids, claimed, sent_at, reclaimed = outbox(run)
+
+    assert len(claimed) == 2
+    assert sent_at is not None
+    assert [email.id for email in reclaimed] == [ids[1]]
+
+
+def test_reschedule_counts_the_attempt_and_backs_off(outbox):
+    async def run(session):
+        [email_id] = await _enqueue(session, 1, attempts=2)
+        await dao.claim_outbox_emails(session, 10, LEASE)
+        await dao.reschedule_email(session, email_id, 'SMTPDataError(550)', retry_delay(2))
+        return await _row(session, email_id)
+
+    started = datetime.datetime.utcnow()
+    email = outbox(run)
+
+    assert email.attempts == 3
+    assert email.last_error == 'SMTPDataError(550)'
+    assert email.sent_at is None
+    expected = started + datetime.timedelta(seconds=retry_delay(2))
+    assert expected - datetime.timedelta(seconds=5) < email.next_attempt_at < expected + datetime.timedelta(seconds=5)
+
+
+def test_retry_delay_doubles_up_to_the_cap():
+    delays = [retry_delay(attempts) for attempts in range(20)]
+
+    assert delays[0] == settings.EMAIL_RETRY_BASE_SECONDS
+    assert delays[1] == 2 * settings.EMAIL_RETRY_BASE_SECONDS
+    assert delays == sorted(delays)
+    assert max(delays) == settings.EMAIL_RETRY_MAX_SECONDS
+
+
+def test_claim_stops_at_max_attempts(outbox):
+    async def run(session):
+        [exhausted] = await _enqueue(session, 1, attempts=settings.EMAIL_MAX_ATTEMPTS)
+        [last_try] = await _enqueue(session, 1, attempts=settings.EMAIL_MAX_ATTEMPTS - 1)
+        return exhausted, last_try, await dao.claim_outbox_emails(session, 10, LEASE)
+
+    exhausted, last_try, claimed = outbox(run)
+
+    assert [email.id for email in claimed] == [last_try]
+
+
+def test_email_rolls_back_with_the_callers_transaction(outbox):
+    async def run(session):
+        with pytest.raises(RuntimeError):
+            async with session.begin():
+                await dao.enqueue_email(session, recipients=['user@example.com'], subject='Order message', body='Hi')
+                await session.flush()
+                raise RuntimeError('order could not be closed')
+        return (await session.execute(select(EmailOutbox))).scalars().all()
+
+    assert outbox(run) == []
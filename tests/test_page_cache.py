@@ -0,0 +1,62 @@
+"""The shared anonymous page cache must not leak request specifics between visitors."""
+import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import dao
+from library.catalogue_cache import ProductSnapshot, catalogue_cache
+from library.page_cache import page_cache
+from library.pagination import Page
+from main import app
+
+
+@pytest.fixture
+def catalogue(monkeypatch):
+    """Serves the home page from a fake catalogue, so no database is needed."""
+    state = {'title': 'Nike Air', 'last_modified': datetime.datetime(2024, 1, 2, 3, 4, 5)}
+
+    async def fetch_products(session, limit=12, q='', cursor=None):
+        product = ProductSnapshot(1, state['title'], 10.0, None, 'air.png', datetime.datetime(2024, 1, 1))
+        return Page(items=[product], next_cursor='next')
+
+    async def get_catalogue_last_modified(session):
+        return state['last_modified']
+
+    monkeypatch.setattr(dao, 'fetch_products', fetch_products)
+    monkeypatch.setattr(dao, 'get_catalogue_last_modified', get_catalogue_last_modified)
+    page_cache.clear()
+    yield state
+    page_cache.clear()
+
+
+def test_cached_page_ignores_host_header(catalogue):
+    client = TestClient(app)
+    client.get('/', headers={'Host': 'evil.example'})
+
+    response = client.get('/')
+
+    assert 'Nike Air' in response.text
+    assert 'evil.example' not in response.text
+    assert 'href="/static/base.scss"' in response.text
+
+
+def test_stale_page_keeps_its_own_validators(catalogue):
+    client = TestClient(app)
+    first = client.get('/')
+
+    catalogue['title'] = 'Adidas Samba'
+    catalogue['last_modified'] = datetime.datetime(2024, 2, 1)
+    catalogue_cache.bump()
+    stale = client.get('/')
+
+    # the old body may be served while it is re-rendered, but never under the new validators
+    assert 'Nike Air' in stale.text
+    assert stale.headers['etag'] == first.headers['etag']
+    assert stale.headers['last-modified'] == first.headers['last-modified']
+
+    fresh = client.get('/', headers={'If-None-Match': stale.headers['etag']})
+    assert fresh.status_code == 200
+    assert 'Adidas Samba' in fresh.text
+    assert fresh.headers['etag'] != first.headers['etag']
+    assert client.get('/', headers={'If-None-Match': fresh.headers['etag']}).status_code == 304
@@ -0,0 +1,75 @@
+"""A request checks out at most one pooled connection, whatever its dependencies and the state of the caches."""
+import asyncio
+import uuid
+from datetime import timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import dao
+from database import engine, replica_engines
+from library.cache import user_cache
+from library.catalogue_cache import catalogue_cache
+from library.page_cache import page_cache
+from library.query_stats import current_stats
+from library.security_lib import AuthHandler
+from main import app
+
+ROUTES = ['/', '/?q=Nike', '/get-reviews', '/cart', '/TechnicalSupport',
+          '/api/public/products/', '/api/public/comments/']
+
+
+@pytest.fixture(scope='module')
+def client(database):
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture(scope='module')
+def token(database):
+    async def create_user(session):
+        return await dao.create_user(
+            name='checkout test', email=f'{uuid.uuid4().hex}@example.com', hashed_password='x', session=session,
+        )
+
+    user = database(create_user)
+    return asyncio.run(AuthHandler.generate_token({'sub': user.id, 'email': user.email}, timedelta(minutes=30)))
+
+
+@pytest.fixture
+def checkouts():
+    paths = []
+
+    def count(*args):
+        # background workers run outside any request and are not counted
+        stats = current_stats.get()
+        if stats is not None:
+            paths.append(stats.scope['path'])
+
+    engines = [engine, *replica_engines]
+    for db_engine in engines:
+        event.listen(db_engine.sync_engine, 'checkout', count)
+    yield paths
+    for db_engine in engines:
+        event.remove(db_engine.sync_engine, 'checkout', count)
+
+
+def _cold_caches():
+    user_cache.clear()
+    catalogue_cache.bump()
+    page_cache.clear()
+
+
+@pytest.mark.parametrize('route', ROUTES)
+@pytest.mark.parametrize('logged_in', [False, True], ids=['anonymous', 'logged_in'])
+def test_one_checkout_per_request(client, token, checkouts, route, logged_in):
+    client.cookies.clear()
+    if logged_in:
+        client.cookies.set('token', token)
+    _cold_caches()
+
+    response = client.get(route, follow_redirects=False)
+
+    assert response.status_code < 500
+    assert len(checkouts) <= 1, f'{route} checked out {len(checkouts)} connections'
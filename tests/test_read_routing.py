@@ -0,0 +1,90 @@
+"""Reads go to a replica unless the client wrote recently; a commit on the primary pins the client to it."""
+import itertools
+import time
+
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import database
+from database import PRIMARY_UNTIL_COOKIE, PrimarySession, get_async_session, get_read_session
+from library.read_your_writes import ReadYourWritesMiddleware
+from settings import settings
+
+# sessions only connect on first use, so routing is checked without a database; in the tests that do connect,
+# the replica is a second engine on the test database standing in for a real replica server
+primary_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+replica_engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+
+app = FastAPI()
+app.add_middleware(ReadYourWritesMiddleware)
+
+
+@app.get('/read')
+async def read(session: AsyncSession = Depends(get_read_session)):
+    return {'replica': session.bind is replica_engine}
+
+
+@app.post('/write')
+async def write(session: AsyncSession = Depends(get_async_session)):
+    await session.execute(text('SELECT 1'))
+    await session.commit()
+
+
+@app.post('/no-write')
+async def no_write(session: AsyncSession = Depends(get_async_session)):
+    await session.execute(text('SELECT 1'))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(database, 'async_session_maker', async_sessionmaker(
+        primary_engine, expire_on_commit=False, sync_session_class=PrimarySession,
+    ))
+    replica_maker = async_sessionmaker(replica_engine, expire_on_commit=False)
+    monkeypatch.setattr(database, 'replica_session_makers', [replica_maker])
+    monkeypatch.setattr(database, '_next_replica', itertools.cycle([replica_maker]))
+    with TestClient(app) as client:
+        yield client
+
+
+def test_reads_go_to_the_replica(client):
+    assert client.get('/read').json() == {'replica': True}
+
+
+def test_reads_stay_on_the_primary_without_replicas(client, monkeypatch):
+    monkeypatch.setattr(database, 'replica_session_makers', [])
+
+    assert client.get('/read').json() == {'replica': False}
+
+
+def test_recent_writer_reads_from_the_primary(client):
+    client.cookies.set(PRIMARY_UNTIL_COOKIE, str(time.time() + 60))
+
+    assert client.get('/read').json() == {'replica': False}
+
+
+def test_expired_or_garbled_cookie_reads_from_the_replica(client):
+    client.cookies.set(PRIMARY_UNTIL_COOKIE, str(time.time() - 1))
+    assert client.get('/read').json() == {'replica': True}
+
+    client.cookies.set(PRIMARY_UNTIL_COOKIE, 'soon')
+    assert client.get('/read').json() == {'replica': True}
+
+
+def test_commit_pins_the_client_to_the_primary(database, client):
+    response = client.post('/write')
+
+    primary_until = float(response.cookies[PRIMARY_UNTIL_COOKIE])
+    assert time.time() < primary_until <= time.time() + settings.READ_YOUR_WRITES_SECONDS
+    assert client.get('/read').json() == {'replica': False}
+
+
+def test_request_without_commit_sets_no_cookie(database, client):
+    response = client.post('/no-write')
+
+    assert PRIMARY_UNTIL_COOKIE not in response.cookies
+    assert client.get('/read').json() == {'replica': True}
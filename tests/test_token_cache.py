@@ -0,0 +1,28 @@
+"""Revoked tokens stay revoked until they expire, however many other tokens are revoked meanwhile."""
+import time
+
+from library.cache import TokenCache
+
+
+def test_revocations_survive_cache_pressure():
+    cache = TokenCache('test_token', max_size=4, ttl=300)
+    expires_at = time.time() + 3600
+
+    for number in range(100):
+        cache.revoke(f'token-{number}', {'exp': expires_at})
+
+    assert all(cache.is_revoked(f'token-{number}') for number in range(100))
+    assert not cache.is_revoked('token-100')
+
+
+def test_expired_revocations_are_dropped():
+    cache = TokenCache('test_expired_token', max_size=4, ttl=300)
+    cache.revoke('expired', {'exp': time.time() - 1})
+    cache.revoke('short', {'exp': time.time() + 0.01})
+    time.sleep(0.02)
+
+    cache.revoke('fresh', {'exp': time.time() + 3600})
+
+    assert not cache.is_revoked('short')
+    assert cache.is_revoked('fresh')
+    assert len(cache._revoked) == 1
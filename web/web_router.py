@@ -1,23 +1,24 @@
 import uuid
-from typing import Optional, List
+from typing import Optional
 
-from fastapi import APIRouter, Request, Depends, Form, UploadFile, File, BackgroundTasks
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import RedirectResponse
+from fastapi import APIRouter, Request, Depends, Form, UploadFile, File
+from fastapi.responses import RedirectResponse, HTMLResponse
 from pydantic import EmailStr
 from fastapi.responses import FileResponse
 from starlette import status
 import datetime
 
-from database import get_async_session
+from database import get_async_session, get_read_session, is_primary, read_session_maker
 from sqlalchemy.ext.asyncio import AsyncSession
 import dao
 
-from pathlib import Path
-
-from library.email_sender import send_email_verification, send_email_order
-from library.security_lib import PasswordEncrypt, SecurityHandler
-from models import Order, OrderProduct, Comments
+from library.conditional import make_etag, is_not_modified, not_modified, add_validators
+from library.page_cache import page_cache
+from library.render import templates, stream_template, relative_url_for
+from library.query_stats import query_budget
+from library.email_sender import queue_email_verification, queue_email_order
+from library.security_lib import AuthHandler, PasswordEncrypt, SecurityHandler
+from models import Order
 
 web_router = APIRouter(
     prefix='',
@@ -25,8 +26,6 @@ web_router = APIRouter(
     include_in_schema=False,
 )
 
-templates = Jinja2Templates(directory=Path(__file__).parent.parent / 'templates')
-
 
 class UserCreateForm:
     def __init__(self, request: Request):
@@ -68,11 +67,12 @@ class UserCreateForm:
 
 
 @web_router.get('/cart')
+@query_budget(4)
 async def cart(request: Request, user=Depends(SecurityHandler.get_current_user_web),
                session: AsyncSession = Depends(get_async_session)):
     if user:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        cart = await dao.fetch_order_products(session, order.id)
+        order = await dao.get_open_order(session, user.id)
+        cart = await dao.fetch_order_products(session, order.id, with_products=True) if order else []
 
         subtotal = sum([product.price * product.quantity for product in cart])
 
@@ -86,11 +86,11 @@ async def cart(request: Request, user=Depends(SecurityHandler.get_current_user_w
         }
 
         response = templates.TemplateResponse('cart.html', context=context)
-        return await SecurityHandler.set_cookies_web(user, response)
+        return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
     else:
         redirect_url = request.url_for('index')
         response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-        return await SecurityHandler.set_cookies_web(user, response)
+        return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/cart/increase_quantity/{cart_product_id}')
@@ -99,16 +99,12 @@ async def increase_product_quantity_in_cart(
         request: Request,
         user=Depends(SecurityHandler.get_current_user_web),
         session: AsyncSession = Depends(get_async_session)):
-    if user:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        order_product = await dao.get_order_product(session, order.id, cart_product_id)
-        if order_product:
-            order_product.quantity += 1
-            session.add(order_product)
-            await session.commit()
+    order = await dao.get_open_order(session, user.id) if user else None
+    if order:
+        await dao.increase_product_quantity_in_order(session, order.id, cart_product_id)
     redirect_url = request.url_for('cart')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/cart/decrease_quantity/{cart_product_id}')
@@ -117,19 +113,12 @@ async def decrease_product_quantity_in_cart(
         request: Request,
         user=Depends(SecurityHandler.get_current_user_web),
         session: AsyncSession = Depends(get_async_session)):
-    if user:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        order_product = await dao.get_order_product(session, order.id, cart_product_id)
-        if order_product and order_product.quantity > 0:
-            order_product.quantity -= 1
-            if order_product.quantity == 0:
-                await dao.delete_order_product(cart_product_id)
-            else:
-                session.add(order_product)
-                await session.commit()
+    order = await dao.get_open_order(session, user.id) if user else None
+    if order:
+        await dao.decrease_product_quantity_in_order(session, order.id, cart_product_id)
     redirect_url = request.url_for('cart')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/cart/delete_product_from_cart/{cart_product_id}')
@@ -138,50 +127,37 @@ async def delete_product_in_cart(
         request: Request,
         user=Depends(SecurityHandler.get_current_user_web),
         session: AsyncSession = Depends(get_async_session)):
-    if user:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        order_product = await dao.get_order_product(session, order.id, cart_product_id)
-        if order_product:
-            await dao.delete_order_product(cart_product_id)
-            session.add(order_product)
-            await session.commit()
+    order = await dao.get_open_order(session, user.id) if user else None
+    if order:
+        await dao.delete_order_product(session, order.id, cart_product_id)
     redirect_url = request.url_for('cart')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/close-order')
 async def close_order(request: Request,
-                      background_tasks: BackgroundTasks,
                       user=Depends(SecurityHandler.get_current_user_web),
                       session: AsyncSession = Depends(get_async_session),
 
                       ):
     if user:
-        order: Order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        cart = await dao.fetch_order_products(session, order.id)
+        order: Order = await dao.get_open_order(session, user.id)
+        cart = await dao.fetch_order_products(session, order.id, with_products=True) if order else []
         if cart:
             order.is_closed = True
             session.add(order)
+            await queue_email_order(session, user_email=user.email, user_name=user.name, order=order, cart=cart)
             await session.commit()
-            await session.close()
-            background_tasks.add_task(
-                send_email_order,
-                user_email=user.email,
-                user_name=user.name,
-                order=order,
-                cart=cart,
-            )
     redirect_url = request.url_for('index')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/signup', description='get form for registration')
 @web_router.post('/signup', description='fill out the registration form')
 async def web_register(
         request: Request,
-        background_tasks: BackgroundTasks,
         session: AsyncSession = Depends(get_async_session),
         avatar: str = Form(None),
 ):
@@ -202,14 +178,16 @@ async def web_register(
             is_admin=is_first_user,
             session=session,
             avatar=avatar,
+            commit=False,
         )
-        background_tasks.add_task(
-            send_email_verification,
+        await queue_email_verification(
+            session,
             user_email=saved_user.email,
             user_uuid=saved_user.user_uuid,
             user_name=saved_user.name,
             host=request.base_url,
         )
+        await session.commit()
         redirect_url = request.url_for('index')
         response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
         return await SecurityHandler.set_cookies_web(saved_user, response)
@@ -237,6 +215,9 @@ async def user_login_web(
 
 @web_router.get('/logout', description='log out')
 async def user_logout_web(request: Request):
+    token = request.cookies.get('token')
+    if token:
+        AuthHandler.revoke_token(token, await AuthHandler.decode_token_web(token))
     response = templates.TemplateResponse('login.html', context={'request': request})
     response.delete_cookie(key='token')
     return response
@@ -260,15 +241,15 @@ async def update_user_data(
         if await user_update_data.is_valid(session, check_email=False):
             hashed_password = await PasswordEncrypt.get_password_hash(user_update_data.password)
 
-            update_user = await dao.update_user(user_id=user.id, values={
+            await dao.update_user(user_id=user.id, values={
                 'hashed_password': hashed_password,
                 'avatar': user_update_data.avatar,
                 'name': user_update_data.name,
 
-            })
+            }, session=session)
             redirect_url = request.url_for('index')
             response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-            return await SecurityHandler.set_cookies_web(update_user, response)
+            return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/add-review')
@@ -283,7 +264,7 @@ async def add_review_get(request: Request, user=Depends(SecurityHandler.get_curr
         'user': user
     }
     response = templates.TemplateResponse('review.html', context=context)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/add-review', description='Add comments')
@@ -305,27 +286,25 @@ async def add_reviews(request: Request,
 
     redirect_url = request.url_for('all_comments')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/get-reviews', description='Getting all comments')
-async def all_comments(request: Request, user=Depends(SecurityHandler.get_current_user_web)):
-
-    review_all: List[Comments] = await dao.fetch_comments()
-
-    users = await dao.fetch_users()
-
-    user_names = {user.id: user.name for user in users}
+@query_budget(4)
+async def all_comments(request: Request, cursor: str = None, user=Depends(SecurityHandler.get_current_user_web),
+                       session: AsyncSession = Depends(get_read_session)):
+    # the session dependency stays open until the streamed body has been sent
+    review_all = await dao.stream_comments(session, cursor=cursor)
 
     context = {
         'request': request,
         'all_comments': review_all,
-        'user_names': user_names,
+        'authors': dao.user_loader(session),
         'user': user
     }
 
-    response = templates.TemplateResponse('all_comments.html', context=context)
-    return await SecurityHandler.set_cookies_web(user, response)
+    response = stream_template('all_comments.html', context=context)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/add-product', description='add-product')
@@ -340,7 +319,7 @@ async def add_product(request: Request, user=Depends(SecurityHandler.get_current
         'user': user,
     }
     response = templates.TemplateResponse('add-product.html', context=context)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/delete-product/{product_id}')
@@ -350,13 +329,10 @@ async def admin_delete_product(
         user=Depends(SecurityHandler.get_current_user_web),
         session: AsyncSession = Depends(get_async_session)):
     if user.is_admin:
-        product = await dao.get_product(session, product_id)
-        if product:
-            await dao.delete_product(product_id)
-            session.add(product)
+        await dao.delete_product(product_id, session)
     redirect_url = request.url_for('index')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.post('/add-product', description='add-product')
@@ -391,7 +367,7 @@ async def add_product_post(
 
     redirect_url = request.url_for('index')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/file/{filename}')
@@ -407,45 +383,86 @@ async def add_product(product_id: int, request: Request,
     if not user:
         redirect_url = request.url_for('user_login_web')
         response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-        return await SecurityHandler.set_cookies_web(user, response)
-
-    product = await dao.get_product(session, product_id)
+        return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
-    if product:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        order_product: OrderProduct = await dao.get_or_create(session=session, model=OrderProduct, order_id=order.id,
-                                                              product_id=product.id)
-        order_product.quantity += 1
-        order_product.price = product.price
-        session.add(order_product)
-        await session.commit()
-        await session.refresh(order_product)
+    await dao.add_product_to_order(session, user.id, product_id)
 
     redirect_url = request.url_for('index')
     response = RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
-    return await SecurityHandler.set_cookies_web(user, response)
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
 
 
 @web_router.get('/')
 @web_router.post('/')
+@query_budget(5)
 async def index(request: Request, query: str = Form(None), search: str = Form(None),
+                q: str = None, cursor: str = None,
                 user=Depends(SecurityHandler.get_current_user_web),
-                session: AsyncSession = Depends(get_async_session)):
-    cart = []
-    if user:
-        order = await dao.get_or_create(session=session, model=Order, user_id=user.id, is_closed=False)
-        cart = await dao.fetch_order_products(session, order.id)
-    products = await dao.fetch_products(session, q=search or query)
-    context = {
+                session: AsyncSession = Depends(get_read_session)):
+    q = search or query or q or ''
+    last_modified = await dao.get_catalogue_last_modified(session)
+    if not user:
+        etag = make_etag('index', q, cursor, last_modified)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(etag, last_modified, vary='Cookie')
+
+        # anonymous pages carry no cart or admin controls, so every visitor can share one rendering;
+        # links are root-relative so the page does not depend on the Host header of the request that rendered it
+        url_for = relative_url_for(request)
+
+        async def revalidate():
+            # a replica could still be behind the bump that made the page stale
+            async with read_session_maker(primary=True)() as fresh_session:
+                return await _render_anonymous_index(url_for, fresh_session, q, cursor)
+
+        body, rendered_last_modified = await page_cache.get_or_render(
+            ('index', q, cursor), lambda: _render_anonymous_index(url_for, session, q, cursor), revalidate,
+            primary=is_primary(session),
+        )
+        # a stale page still being revalidated goes out with the validators it was rendered with
+        if rendered_last_modified != last_modified:
+            etag, last_modified = make_etag('index', q, cursor, rendered_last_modified), rendered_last_modified
+            if is_not_modified(request, etag, last_modified):
+                return not_modified(etag, last_modified, vary='Cookie')
+        return add_validators(HTMLResponse(body), etag, last_modified, vary='Cookie')
+
+    order = await dao.get_open_order(session, user.id)
+    cart = await dao.fetch_order_products(session, order.id) if order else []
+    # cart rows carry no timestamps, so logged in pages are validated by ETag alone
+    etag = make_etag('index', q, cursor, last_modified, user.id, user.name, user.is_admin, _cart_version(cart))
+    if is_not_modified(request, etag):
+        response = not_modified(etag, private=True, vary='Cookie')
+    else:
+        page = await dao.fetch_products(session, q=q, cursor=cursor)
+        response = stream_template('index.html', _index_context(request, page, q, user, cart))
+        add_validators(response, etag, private=True, vary='Cookie')
+    return await SecurityHandler.set_cookies_web(user, response, request.state.token_payload)
+
+
+def _cart_version(cart: list) -> tuple:
+    return tuple((item.id, item.product_id, item.quantity) for item in cart)
+
+
+def _index_context(request: Request, page, q: str, user=None, cart=None) -> dict:
+    return {
         'request': request,
         'user': user,
-        'products': products,
-        'cart': cart,
+        'products': page.items,
+        'next_cursor': page.next_cursor,
+        'q': q,
+        'cart': cart or [],
         'brands': ['Nike', 'Adidas', 'Jordan'],
     }
 
-    response = templates.TemplateResponse('index.html', context=context)
-    return await SecurityHandler.set_cookies_web(user, response)
+
+async def _render_anonymous_index(url_for, session: AsyncSession, q: str,
+                                  cursor: str | None) -> tuple[str, datetime.datetime | None]:
+    """The page and the catalogue validator it was rendered at, read first so it never claims newer content."""
+    last_modified = await dao.get_catalogue_last_modified(session)
+    page = await dao.fetch_products(session, q=q, cursor=cursor)
+    # the context's url_for shadows the environment global, which would build absolute URLs from the request
+    context = {**_index_context(None, page, q), 'url_for': url_for}
+    return templates.get_template('index.html').render(context), last_modified
 
 
 @web_router.get('/TechnicalSupport')